@@ -11,15 +11,22 @@ from sklearn.decomposition import PCA
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
+from joblib import Parallel, delayed, effective_n_jobs
 
-def preProc(zillow_df, ytype='log'):
+from model_functions import FeatureMatrix, build_feature_matrix
+
+def preProc(zillow_df, ytype='log', as_matrix=False):
     '''
     Input a dataframe of features + target rent.
     Will return X (with label encoding for non-numeric features)
     'y_type' argument allows you to specify how the feature should be treated;
     'y_type' = 'log' will return a log-transformed rent pd.Series
     'y_type' = 'normal' will return the original rent pd.Series
+    'as_matrix' = True will instead return a single FeatureMatrix (float32 features + target),
+    which train_test and randForest also accept
     '''
+    if as_matrix:
+        return build_feature_matrix(zillow_df, drop=['Rent'], ytype=ytype, encode_objects=True)
     LE = LabelEncoder() 
     features = zillow_df.copy()
     features = features.drop('Rent',axis=1).copy()
@@ -36,10 +43,15 @@ def preProc(zillow_df, ytype='log'):
         y = zillow_df['Rent']
     return X,y
 
-def train_test(X,y):
+def train_test(X,y=None):
     '''
     Input the output of the preProc function. Make sure 'Date' is the index of X dataframe.
+    X can also be a FeatureMatrix (y is then taken from it); the train/test sets are views of it
+    when its rows are sorted by date (as preProc(as_matrix=True) builds it).
     '''
+    if isinstance(X,FeatureMatrix):
+        train,test = X.split('2019-01-01')
+        return train.frame(),test.frame(),train.target(),test.target()
     Xtrain = X.loc[X.index <'2019-01-01']
     train_index = Xtrain.shape[0]
     Xtest = X[train_index:]
@@ -91,11 +103,20 @@ def featurePlotPCA(df, figure_size = (8,5), df_name='features'):
     heatmap.set_title(titl)
     plt.show()
 
-def randForest(model,Xtrain,Xtest,ytrain,ytest):
+def randForest(model,Xtrain,Xtest,ytrain=None,ytest=None,perm_importance=False):
     '''
     Input a -tuned- model, train/test for feature/target.
     Will output the test and training R2, test RMSE.
+    'perm_importance' = True will add the test-set permutation importances (see permImportance)
+    next to the impurity-based feature importances.
+    Xtrain/Xtest can also be FeatureMatrix objects (leave ytrain/ytest as None to use their targets).
     '''
+    if isinstance(Xtrain,FeatureMatrix):
+        ytrain = Xtrain.target() if ytrain is None else ytrain
+        Xtrain = Xtrain.frame()
+    if isinstance(Xtest,FeatureMatrix):
+        ytest = Xtest.target() if ytest is None else ytest
+        Xtest = Xtest.frame()
     model.fit(Xtrain,ytrain)
     print(f'training R2: {model.score(Xtrain,ytrain)}')
     print(f'test R2: {model.score(Xtest,ytest)}')
@@ -106,4 +127,54 @@ def randForest(model,Xtrain,Xtest,ytrain,ytest):
     print(f'RMSE: {RMSE}')
     
     feature_imps = pd.DataFrame({'Columns':Xtrain.columns,'Feature_importances':model.feature_importances_})
-    return feature_imps.sort_values('Feature_importances',ascending=False)
\ No newline at end of file
+    if perm_importance:
+        perm_imps = permImportance(model,Xtest,ytest)
+        feature_imps = feature_imps.merge(perm_imps,on='Columns',how='left')
+    return feature_imps.sort_values('Feature_importances',ascending=False)
+
+def _r2(y,ypred):
+    return 1 - ((y-ypred)**2).sum() / ((y-y.mean())**2).sum()
+
+def _permuteColumns(model,X,y,columns,jobs,seeds):
+    '''
+    Scores the model with one column at a time shuffled. X is copied once into a buffer
+    that is shuffled and restored column by column.
+    '''
+    buffer = X.copy()
+    X_buffer = pd.DataFrame(buffer,columns=columns,copy=False) if columns is not None else buffer
+    scores = []
+    for (col,seed) in zip(jobs,seeds):
+        perm = np.random.default_rng(seed).permutation(X.shape[0])
+        buffer[:,col] = X[perm,col]
+        scores.append(_r2(y,model.predict(X_buffer)))
+        buffer[:,col] = X[:,col]
+    return scores
+
+def permImportance(model,Xtest,ytest,n_repeats=5,n_jobs=-1,random_state=None):
+    '''
+    Input a -fitted- model and a test set for feature/target.
+    Will output the permutation importance of every feature: the mean (and std) drop in
+    test R2 when that feature is shuffled, over 'n_repeats' shuffles.
+    Unlike the impurity-based feature_importances_, this is not biased toward
+    high-cardinality (label encoded) columns such as Zipcode.
+    The (feature, repeat) jobs are spread over 'n_jobs' threads; each thread shuffles
+    columns in its own copy of Xtest instead of copying Xtest per feature.
+    '''
+    columns = list(Xtest.columns) if isinstance(Xtest,pd.DataFrame) else None
+    X = np.ascontiguousarray(Xtest,dtype=np.float32)
+    y = np.asarray(ytest,dtype=np.float64)
+    baseline = _r2(y,model.predict(pd.DataFrame(X,columns=columns,copy=False) if columns else X))
+
+    n_features = X.shape[1]
+    jobs = np.repeat(np.arange(n_features),n_repeats)
+    seeds = np.random.SeedSequence(random_state).generate_state(len(jobs))
+    n_workers = min(effective_n_jobs(n_jobs),len(jobs))
+    batches = np.array_split(np.arange(len(jobs)),n_workers)
+    results = Parallel(n_jobs=n_workers,prefer='threads')(
+        delayed(_permuteColumns)(model,X,y,columns,jobs[batch],seeds[batch]) for batch in batches)
+
+    drops = (baseline - np.concatenate(results)).reshape(n_features,n_repeats)
+    perm_imps = pd.DataFrame({'Columns':columns if columns else np.arange(n_features),
+                              'Permutation_importance':drops.mean(axis=1),
+                              'Permutation_std':drops.std(axis=1)})
+    return perm_imps.sort_values('Permutation_importance',ascending=False)
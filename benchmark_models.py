@@ -0,0 +1,245 @@
+'''
+Modeling benchmarks
+
+Times forest_regressor, forest_clusters and PCARandomForest.randForest on synthetic panels
+shaped like zillow_full, and records fit time, predict throughput, single-zipcode latency,
+peak RSS and serialized model size. Timings are medians over repeated runs. The randForest
+case also records the time of the whole randForest call (fit, scoring and permutation importance). Every case runs in a fresh process so peak RSS is per case.
+
+Usage:
+    python benchmark_models.py --save baseline.json
+    python benchmark_models.py --compare baseline.json --threshold 0.2
+'''
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import pickle
+import platform
+import resource
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+from joblib import parallel_backend
+
+# lower is better for every metric except predict throughput
+metric_directions = {'fit_s': 'lower',
+                     'predict_rows_per_s': 'higher',
+                     'zipcode_latency_ms': 'lower',
+                     'peak_rss_mb': 'lower',
+                     'model_mb': 'lower',
+                     'randforest_s': 'lower'}
+
+census_features = ['total_pop', 'households', 'median_age', 'median_income', 'income_per_capita',
+                   'gini_index', 'pct_poverty', 'housing_availability', 'home_density', 'pct_employed',
+                   'pct_jobs_nightlife', 'pct_unemployed', 'move_within_city', 'move_new_city',
+                   'avg_commute_time', 'pct_college']
+
+split_date = '2019-01-01'
+
+
+def synthetic_panel(n_zipcodes, n_months, n_clusters=4, seed=0):
+    '''
+    Returns a synthetic panel with the zillow_full schema, indexed by Date
+
+    Args:
+    n_zipcodes: int, number of zipcodes
+    n_months: int, number of months starting in 2015-01
+    n_clusters: int, number of values of the 'Clusters' column
+    seed: int, random seed
+    '''
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2015-01-01', periods=n_months, freq='MS')
+    n_rows = n_zipcodes * n_months
+    states = np.array(['CA', 'NY', 'TX', 'FL'])
+    counties = np.array(['Alameda County', 'Kings County', 'Travis County', 'Broward County'])
+    metros = np.array(['San Francisco', 'New York', 'Austin', 'Miami-Fort Lauderdale'])
+    zip_state = rng.integers(0, 4, n_zipcodes)
+
+    def per_zip(values):
+        return np.tile(values, n_months)
+
+    census = {col: per_zip(rng.lognormal(0, 1, n_zipcodes)) for col in census_features}
+    base_rent = rng.uniform(900, 4500, n_zipcodes)
+    trend = np.repeat(np.arange(n_months), n_zipcodes)
+    rent = per_zip(base_rent) * (1 + 0.002 * trend) * rng.normal(1, 0.01, n_rows)
+
+    panel = pd.DataFrame({'Zipcode': per_zip(np.char.zfill(np.arange(n_zipcodes).astype(str), 5)),
+                          'City': per_zip(metros[zip_state]),
+                          'State': per_zip(states[zip_state]),
+                          'Metro': per_zip(metros[zip_state]),
+                          'County': per_zip(counties[zip_state]),
+                          'SizeRank': per_zip(np.arange(n_zipcodes)),
+                          'Date': np.repeat(dates, n_zipcodes),
+                          'Rent': rent})
+    panel['Year'] = panel['Date'].dt.year
+    panel['State-County'] = panel['State'] + '-' + panel['County']
+    panel['AQIMean'] = rng.uniform(0, 1, n_rows)
+    panel['PersonalIncome'] = rng.uniform(5e4, 8e4, n_rows)
+    panel['Vol_moderate_income'] = np.repeat(rng.uniform(0, 1, n_months), n_zipcodes)
+    panel['Vol_low_income'] = np.repeat(rng.uniform(0, 1, n_months), n_zipcodes)
+    panel = pd.concat([panel, pd.DataFrame(census)], axis=1)
+    panel['Clusters'] = per_zip(rng.integers(0, n_clusters, n_zipcodes))
+    return panel.set_index('Date')
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _median_seconds(func, repeats):
+    '''Returns the median wall time of repeats calls of func, and the result of the last call'''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def _zipcode_latency_ms(predict, X, zipcodes, repeats=20):
+    '''Median time to predict all test rows of one zipcode'''
+    one_zip = X[zipcodes == zipcodes[0]]
+    return 1000 * _median_seconds(lambda: predict(one_zip), repeats)[0]
+
+
+def _throughput(predict, X, repeats=5):
+    '''Median rows per second predicting all test rows'''
+    return len(X) / _median_seconds(lambda: predict(X), repeats)[0]
+
+
+def _run_case(case):
+    '''Runs one benchmark case (in its own process) and returns its metrics'''
+    import model_functions
+    import PCARandomForest
+
+    panel = synthetic_panel(case['zipcodes'], case['months'])
+    test_zips = panel.loc[panel.index >= split_date, 'Zipcode'].to_numpy()
+    repeats = case.get('repeats', 3)
+    extra = dict()
+
+    if case['model'] == 'forest_regressor':
+        fit_s, (model, Xtest, ytest) = _median_seconds(
+            lambda: model_functions.forest_regressor(panel.drop('Clusters', axis=1), split_date,
+                                                     case['n_estimators'], case['n_jobs']), repeats)
+    elif case['model'] == 'forest_clusters':
+        fit_s, results = _median_seconds(
+            lambda: model_functions.forest_clusters(panel, split_date, case['n_estimators'], case['n_jobs']),
+            repeats)
+        model = results['models']
+        Xtest = panel.loc[panel.index >= split_date].drop(model_functions.feature_cols, axis=1)
+    elif case['model'] == 'randForest':
+        from sklearn.ensemble import RandomForestRegressor
+        features = panel.drop(['Clusters', 'City', 'Metro', 'State-County', 'Zipcode'], axis=1)
+        X, y = PCARandomForest.preProc(features)
+        Xtrain, Xtest, ytrain, ytest = PCARandomForest.train_test(X, y)
+        model = RandomForestRegressor(n_estimators=case['n_estimators'], n_jobs=case['n_jobs'])
+        # fit_s is the fit alone (comparable across cases); randforest_s the whole call with its scoring
+        fit_s, model = _median_seconds(lambda: model.fit(Xtrain, ytrain), repeats)
+        # cases run in daemonic pool workers, where joblib cannot start loky workers; permImportance
+        # prefers threads anyway, so the threading backend keeps its real parallelism
+        with contextlib.redirect_stdout(io.StringIO()), parallel_backend('threading'):
+            extra['randforest_s'] = _median_seconds(
+                lambda: PCARandomForest.randForest(model, Xtrain, Xtest, ytrain, ytest, perm_importance=True),
+                repeats)[0]
+    else:
+        raise ValueError(f"unknown model {case['model']}")
+
+    predict = model.predict
+    return {'fit_s': fit_s,
+            'predict_rows_per_s': _throughput(predict, Xtest),
+            'zipcode_latency_ms': _zipcode_latency_ms(predict, Xtest, test_zips),
+            'peak_rss_mb': _peak_rss_mb(),
+            'model_mb': len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1024 ** 2,
+            **extra}
+
+
+def case_name(case):
+    return (f"{case['model']}[zipcodes={case['zipcodes']},months={case['months']},"
+            f"n_estimators={case['n_estimators']},n_jobs={case['n_jobs']}]")
+
+
+def run_benchmarks(models, zipcodes, months, estimators, jobs, repeats=3):
+    '''
+    Returns the benchmark results for every combination of the arguments
+
+    Args:
+    models: list of str, any of 'forest_regressor', 'forest_clusters', 'randForest'
+    zipcodes: list of int, panel sizes (number of zipcodes)
+    months: int, number of months in the panels (months from 2019-01 on are the test set)
+    estimators: list of int, n_estimators values
+    jobs: list of int, n_jobs values
+    repeats: int, number of fits per case (fit_s is the median)
+    '''
+    cases = [{'model': model, 'zipcodes': n_zip, 'months': months, 'n_estimators': n_est, 'n_jobs': n_jobs,
+              'repeats': repeats}
+             for model, n_zip, n_est, n_jobs in itertools.product(models, zipcodes, estimators, jobs)]
+    results = dict()
+    context = multiprocessing.get_context('spawn')
+    for case in cases:
+        with context.Pool(1) as pool:
+            metrics = pool.apply(_run_case, (case,))
+        results[case_name(case)] = {'case': case, 'metrics': metrics}
+        print(f"{case_name(case)}: " + ', '.join(f'{k}={v:.4g}' for k, v in metrics.items()))
+    return {'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': multiprocessing.cpu_count()},
+            'results': results}
+
+
+def compare(baseline, current, threshold=0.2):
+    '''
+    Returns a DataFrame comparing current results to a baseline, flagging regressions
+    (a metric worse than the baseline by more than threshold, as a fraction)
+
+    Args:
+    baseline: dict, saved output of run_benchmarks
+    current: dict, output of run_benchmarks
+    threshold: float, tolerated relative change
+    '''
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        for metric, value in result['metrics'].items():
+            if metric not in baseline['results'][name]['metrics']:
+                continue
+            base = baseline['results'][name]['metrics'][metric]
+            change = (value - base) / base if base else 0.0
+            worse = change if metric_directions[metric] == 'lower' else -change
+            rows.append({'case': name, 'metric': metric, 'baseline': base, 'current': value,
+                         'change': change, 'regression': worse > threshold})
+    return pd.DataFrame(rows, columns=['case', 'metric', 'baseline', 'current', 'change', 'regression'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=['forest_regressor', 'forest_clusters', 'randForest'])
+    parser.add_argument('--zipcodes', nargs='+', type=int, default=[200, 800])
+    parser.add_argument('--months', type=int, default=60)
+    parser.add_argument('--estimators', nargs='+', type=int, default=[100])
+    parser.add_argument('--jobs', nargs='+', type=int, default=[1, -1])
+    parser.add_argument('--repeats', type=int, default=3, help='fits per case, fit_s is the median (default 3)')
+    parser.add_argument('--save', help='write the results to this baseline file')
+    parser.add_argument('--compare', help='compare the results to this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='tolerated relative change (default 0.2)')
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.models, args.zipcodes, args.months, args.estimators, args.jobs, args.repeats)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare(baseline, current, args.threshold)
+        with pd.option_context('display.width', 200, 'display.max_rows', None):
+            print(comparison)
+        if comparison['regression'].any():
+            print(f"{comparison['regression'].sum()} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
@@ -0,0 +1,137 @@
+'''
+Zipcode clustering
+
+The ACS features are per zipcode, so the panel is collapsed to one row per zipcode
+(or zipcode-year) before clustering instead of clustering every zipcode-month row.
+The labels are attached straight back onto the panel as 'Clusters' (the column
+forest_clusters slices by) and can be cached on disk by feature hash.
+'''
+import hashlib
+import os
+
+import pandas as pd
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import normalize
+from scipy.cluster.hierarchy import linkage, fcluster
+
+# columns left out of the clustering features (same as the cluster EDA notebook, which
+# clusters on the ACS features only, without the state, county and national averages)
+exclude_cols = ['Date', 'SizeRank', 'Rent', 'Year', 'Clusters',
+                'PersonalIncome', 'AQIMean', 'Vol_moderate_income', 'Vol_low_income']
+
+
+def zipcode_features(df, by_year=False):
+    '''
+    Returns the numeric features averaged to one row per zipcode (or per zipcode-year)
+
+    Args:
+    df: pd.DataFrame, panel with a 'Zipcode' column (and 'Year' if by_year)
+    by_year: bool, keep one row per zipcode-year instead of per zipcode
+    '''
+    keys = ['Zipcode', 'Year'] if by_year else ['Zipcode']
+    numeric = df.select_dtypes(exclude=['object']).columns
+    features = [col for col in numeric if col not in exclude_cols + keys]
+    return df.groupby(keys, sort=True)[features].mean()
+
+
+def condensed_distances(X, block_size=2048):
+    '''
+    Returns the condensed euclidean distance matrix of X (as scipy's pdist) in float32,
+    half the memory of pdist's float64 output, computed in row blocks.
+
+    Args:
+    X: np.array, observations by features
+    block_size: int, number of rows whose distances are computed at a time
+    '''
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n = X.shape[0]
+    sq_norms = np.einsum('ij,ij->i', X, X)
+    dists = np.empty(n * (n - 1) // 2, dtype=np.float32)
+    pos = 0
+    for start in range(0, n - 1, block_size):
+        stop = min(start + block_size, n - 1)
+        block = sq_norms[start:stop, None] + sq_norms[None, start:] - 2 * X[start:stop] @ X[start:].T
+        np.maximum(block, 0, out=block)
+        np.sqrt(block, out=block)
+        for i in range(start, stop):
+            row = block[i - start, i - start + 1:]
+            dists[pos:pos + row.size] = row
+            pos += row.size
+    return dists
+
+
+def _feature_hash(features, params):
+    key = hashlib.sha1()
+    key.update(np.ascontiguousarray(features.to_numpy(dtype=np.float64)).tobytes())
+    key.update(pd.util.hash_pandas_object(features.index.to_frame(), index=False).to_numpy().tobytes())
+    key.update(','.join(features.columns).encode())
+    key.update(repr(sorted(params.items())).encode())
+    return key.hexdigest()
+
+
+def cluster_zipcodes(df, n_clusters=4, method='kmeans', by_year=False, cache_dir=None,
+                     random_state=0, batch_size=1024):
+    '''
+    Returns a pd.Series of cluster labels (0 .. n_clusters-1) indexed by Zipcode
+    (or by Zipcode and Year), named 'Clusters'
+
+    Args:
+    df: pd.DataFrame, panel with a 'Zipcode' column (e.g. zillow_full)
+    n_clusters: int, number of clusters
+    method: str, 'kmeans' (MiniBatchKMeans) or 'hierarchical' (complete linkage on a float32
+        condensed distance matrix; scipy's linkage still makes a float64 working copy, so this
+        is meant for the collapsed zipcode table, not the panel)
+    by_year: bool, cluster zipcode-years instead of zipcodes
+    cache_dir: str, optional folder where the labels are cached by feature hash
+    random_state: int, seed for MiniBatchKMeans
+    batch_size: int, MiniBatchKMeans batch size
+    '''
+    if method not in ('kmeans', 'hierarchical'):
+        raise ValueError("method must be 'kmeans' or 'hierarchical'")
+
+    features = zipcode_features(df, by_year=by_year)
+    features = features.fillna(features.mean())
+
+    cache_file = None
+    if cache_dir is not None:
+        params = {'n_clusters': n_clusters, 'method': method, 'random_state': random_state,
+                  'batch_size': batch_size}
+        cache_file = os.path.join(cache_dir, f'clusters_{_feature_hash(features, params)}.npy')
+        if os.path.exists(cache_file):
+            return pd.Series(np.load(cache_file), index=features.index, name='Clusters')
+
+    # column-normalized features, as in the cluster EDA notebook
+    X = normalize(features.to_numpy(dtype=np.float64), axis=0).astype(np.float32)
+    if method == 'kmeans':
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size,
+                                 random_state=random_state, n_init=3)
+        labels = kmeans.fit_predict(X)
+    else:
+        tree = linkage(condensed_distances(X), method='complete')
+        labels = fcluster(tree, n_clusters, criterion='maxclust')
+
+    # consecutive labels starting at 0 (forest_clusters loops over range(n_clusters))
+    labels = np.unique(labels, return_inverse=True)[1].astype(np.int64)
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_file, labels)
+    return pd.Series(labels, index=features.index, name='Clusters')
+
+
+def attach_clusters(df, labels):
+    '''
+    Returns a copy of df with a 'Clusters' column looked up from labels
+
+    Args:
+    df: pd.DataFrame, panel with 'Zipcode' (and 'Year' if labels are per zipcode-year)
+    labels: pd.Series, output of cluster_zipcodes
+    '''
+    panel = df.copy()
+    if labels.index.nlevels == 2:
+        keys = pd.MultiIndex.from_arrays([panel['Zipcode'], panel['Year']])
+        panel['Clusters'] = labels.reindex(keys).to_numpy()
+    else:
+        panel['Clusters'] = panel['Zipcode'].map(labels).to_numpy()
+    return panel
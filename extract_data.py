@@ -1,23 +1,35 @@
 from transformers import *
+from panel_store import write_panel
+from panel_tensor import export_tensor
+from panel_schema import normalize_panel
 
 zillow_path = '../../data/zillow/Zip_Zri_MultiFamilyResidenceRental.csv'
 airqual_path = '../../data/airqual/' #path to folder
 persinc_path = '../../data/real_personal_income.csv'
 inclvl_path = '../../data/volume_data_Income_Level_CRC.csv'
 census_path = '../../data/census-query.csv'
+# optional county centroids (Census Gazetteer) used to fill air quality for counties without a
+# monitor from nearby monitored counties (matched by county FIPS code). The general fill is
+# opt-in: the default None keeps the New York City average fill for the NYC counties only
+centroids_path = None #'../../data/2020_Gaz_counties_national.txt'
 
-zillow_data = transform_zillow(zillow_path)
-airqual_data = transform_air_qual(airqual_path)
-persinc_data = transform_pers_income(persinc_path)
-inclvl_data = transform_income_level(inclvl_path)
-census_data = transform_census(census_path)
+# load the independent sources concurrently (set to False to load them one after another)
+concurrent_load = True
+# optional SQLite copy of zillow_full for indexed slicing (see panel_store.query_panel)
+sqlite_path = None #'../../data/zillow_full.db'
+# optional memory-mapped zipcode x month x feature cube (see panel_tensor.load_tensor)
+tensor_dir = None #'../../data/zillow_tensor'
+# optional normalized copy (rent facts + dimension tables, see panel_schema.StarPanel)
+star_dir = None #'../../data/zillow_star'
 
-zillow_full = join_dfs(
-						zillow_data,
-						airqual_data,
-						persinc_data,
-						inclvl_data,
-						census_data
+zillow_full = build_zillow_full(
+						zillow_path,
+						airqual_path,
+						persinc_path,
+						inclvl_path,
+						census_path,
+						concurrent = concurrent_load,
+						centroids_path = centroids_path
 						)
 
 # Imputation missing numerical values with county mean
@@ -27,4 +39,11 @@ null_cols = null_data[null_data >=1 ].index.tolist()
 for col in null_cols:
     zillow_full[col] = impute_by_county(zillow_full, col, 'mean')
 
+if sqlite_path is not None:
+    write_panel(zillow_full, sqlite_path)
+if tensor_dir is not None:
+    export_tensor(zillow_full, tensor_dir)
+if star_dir is not None:
+    normalize_panel(zillow_full).save(star_dir)
+
 print('Your data is ready! Merged table name is zillow_full.')
\ No newline at end of file
@@ -0,0 +1,177 @@
+'''
+Multi-horizon rent forecasting
+
+Forecasts 1, 2 and 5 years out for every zipcode at once. Each forecast step is a
+single batched predict over the whole zipcode set; lag features are shifted in place
+between steps instead of looping per zipcode or per month.
+'''
+from sklearn.ensemble import RandomForestRegressor
+import pandas as pd
+import numpy as np
+
+from model_functions import feature_cols
+
+# forecast horizons in months (1, 2 and 5 years)
+default_horizons = (12, 24, 60)
+
+
+def lag_columns(n_lags):
+    '''Returns the names of the log-rent lag features, most recent first'''
+    return [f'Rent_lag{lag}' for lag in range(1, n_lags + 1)]
+
+
+def add_rent_lags(df, n_lags=12):
+    '''
+    Returns a copy of df with log-rent lag features (Rent_lag1 ... Rent_lagN) per zipcode.
+    Rows without a full lag history are left with NaN lags; drop them before fitting.
+
+    Args:
+    df: pd.DataFrame, panel indexed by Date with a 'Zipcode' and a 'Rent' column
+    n_lags: int, number of monthly lags to add
+    '''
+    panel = df.reset_index()
+    panel = panel.sort_values(['Zipcode', 'Date'], kind='stable')
+    log_rent = np.log(panel['Rent'])
+    by_zip = log_rent.groupby(panel['Zipcode'])
+    for lag, col in enumerate(lag_columns(n_lags), start=1):
+        panel[col] = by_zip.shift(lag)
+    panel = panel.sort_values('Date', kind='stable').set_index('Date')
+    return panel
+
+
+def _origin_rows(df):
+    '''Returns the last observed row of every zipcode'''
+    panel = df.reset_index().sort_values(['Zipcode', 'Date'], kind='stable')
+    last = panel.groupby('Zipcode', sort=True).tail(1)
+    return last.reset_index(drop=True)
+
+
+def _model_features(model):
+    try:
+        return list(model.feature_names_in_)
+    except AttributeError:
+        raise ValueError('model must be fit on a DataFrame so its feature names are known')
+
+
+def _forecast_frame(zipcodes, origin, horizons, log_preds):
+    '''Builds the long forecast frame (Date index; Zipcode, Horizon, Rent columns)'''
+    n_zip = len(zipcodes)
+    dates = [origin + pd.DateOffset(months=h) for h in horizons]
+    forecasts = pd.DataFrame({'Date': np.repeat(dates, n_zip),
+                              'Zipcode': np.tile(zipcodes, len(horizons)),
+                              'Horizon': np.repeat(horizons, n_zip),
+                              'Rent': np.exp(log_preds.T.ravel())})
+    return forecasts.set_index('Date')
+
+
+def _training_features(df, n_lags):
+    '''Returns the rows with a full lag history (sorted by Zipcode, Date) and their model features'''
+    panel = df.reset_index().sort_values(['Zipcode', 'Date'], kind='stable')
+    panel = panel.dropna(subset=lag_columns(n_lags))
+    X = panel.drop(['Date'] + feature_cols, axis=1, errors='ignore')
+    X = X.select_dtypes(exclude=['object'])
+    return panel, X
+
+
+def fit_recursive_model(df, n_lags=12, n_estimators=600):
+    '''
+    Returns a Random Forest model trained to predict the row's log rent from its lags and
+    features (recursive strategy, see forecast_rents), with the same features as fit_direct_models.
+
+    Args:
+    df: pd.DataFrame, output of add_rent_lags (Date index, Zipcode, Rent and numeric features)
+    n_lags: int, number of lag features present in df
+    n_estimators: int, number of trees
+    '''
+    panel, X = _training_features(df, n_lags)
+    rfc = RandomForestRegressor(n_estimators=n_estimators, n_jobs=-1)
+    rfc.fit(X, np.log(panel['Rent']))
+    return rfc
+
+
+def fit_direct_models(df, horizons=default_horizons, n_lags=12, n_estimators=600):
+    '''
+    Returns a dict of Random Forest models keyed by horizon, each trained to predict the
+    log rent `horizon` months after the row's date (direct multi-horizon strategy).
+
+    Args:
+    df: pd.DataFrame, output of add_rent_lags (Date index, Zipcode, Rent and numeric features)
+    horizons: iterable of int, horizons in months
+    n_lags: int, number of lag features present in df
+    n_estimators: int, number of trees per horizon model
+    '''
+    panel, X = _training_features(df, n_lags)
+    by_zip = np.log(panel['Rent']).groupby(panel['Zipcode'])
+
+    models = dict()
+    for horizon in horizons:
+        target = by_zip.shift(-horizon)
+        known = target.notnull().to_numpy()
+        rfc = RandomForestRegressor(n_estimators=n_estimators, n_jobs=-1)
+        rfc.fit(X[known], target[known])
+        models[horizon] = rfc
+    return models
+
+
+def forecast_rents(model, df, horizons=default_horizons, n_lags=12, method='recursive'):
+    '''
+    Returns rent forecasts (in dollars) for every zipcode in df at each requested horizon.
+    Forecasts start from the panel's last month (zipcodes that stop earlier are skipped);
+    non-lag features are held at their last observed value ('Year' is advanced if the model uses it).
+
+    Args:
+    model: fitted model from fit_recursive_model (recursive) or dict of {horizon: fitted model}
+           from fit_direct_models (direct)
+    df: pd.DataFrame, output of add_rent_lags (Date index, Zipcode, Rent and model features)
+    horizons: iterable of int, horizons in months
+    n_lags: int, number of lag features the model was trained with
+    method: str, 'recursive' (one model fed its own predictions) or 'direct' (one model per horizon)
+    '''
+    horizons = sorted(set(int(h) for h in horizons))
+    if horizons[0] < 1:
+        raise ValueError('horizons must be positive numbers of months')
+
+    last = _origin_rows(df)
+    origin = last['Date'].max()
+    last = last[last['Date'] == origin].reset_index(drop=True)
+    zipcodes = last['Zipcode'].to_numpy()
+    lags = lag_columns(n_lags)
+
+    if method == 'direct':
+        if not isinstance(model, dict):
+            raise TypeError('direct forecasting needs a dict of {horizon: model}')
+        log_preds = np.empty((len(zipcodes), len(horizons)))
+        for i, horizon in enumerate(horizons):
+            features = _model_features(model[horizon])
+            X = pd.DataFrame(last[features].to_numpy(dtype=np.float32), columns=features)
+            log_preds[:, i] = model[horizon].predict(X)
+        return _forecast_frame(zipcodes, origin, horizons, log_preds)
+
+    if method != 'recursive':
+        raise ValueError("method must be 'recursive' or 'direct'")
+
+    features = _model_features(model)
+    missing = [col for col in lags if col not in features]
+    if missing:
+        raise ValueError(f'model was not trained on lag features {missing}')
+    lag_idx = np.array([features.index(col) for col in lags])
+    year_idx = features.index('Year') if 'Year' in features else None
+
+    # state at the first forecast month: lag1 is the last observed log rent
+    X = np.ascontiguousarray(last[features].to_numpy(dtype=np.float32))
+    X[:, lag_idx[1:]] = X[:, lag_idx[:-1]]
+    X[:, lag_idx[0]] = np.log(last['Rent'].to_numpy())
+    X_frame = pd.DataFrame(X, columns=features, copy=False)
+
+    steps = horizons[-1]
+    keep = {h: i for i, h in enumerate(horizons)}
+    log_preds = np.empty((len(zipcodes), len(horizons)))
+    for step in range(1, steps + 1):
+        if year_idx is not None:
+            X[:, year_idx] = (origin + pd.DateOffset(months=step)).year
+        pred = model.predict(X_frame)
+        if step in keep:
+            log_preds[:, keep[step]] = pred
+        X[:, lag_idx[1:]] = X[:, lag_idx[:-1]]
+        X[:, lag_idx[0]] = pred
+    return _forecast_frame(zipcodes, origin, horizons, log_preds)
@@ -0,0 +1,160 @@
+'''
+Geometry cache for the cluster choropleth maps
+
+The state zipcode GeoJSON files hold every zipcode of the state while the maps only draw the
+few hundred in our panel. prepare_geojson keeps only those zipcodes, simplifies the polygons
+(Douglas-Peucker) and rounds the coordinates, and the result is cached as a compact per-metro
+file that plotly's choropleth_mapbox can take directly.
+'''
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# property holding the zipcode in the state files (featureidkey='properties.ZCTA5CE10')
+zip_key = 'ZCTA5CE10'
+
+# metro: (state GeoJSON file, counties), as in the cluster map notebook
+metros = {'sf': ('ca_california_zip_codes_geo.min.json',
+                 ['Alameda County', 'Contra Costa County', 'Marin County', 'Napa County', 'San Mateo County',
+                  'Santa Clara County', 'Solano County', 'Sonoma County', 'San Francisco County']),
+          'ny': ('ny_new_york_zip_codes_geo.min.json',
+                 ['New York County', 'Bronx County', 'Queens County', 'Kings County', 'Richmond County']),
+          'au': ('tx_texas_zip_codes_geo.min.json',
+                 ['Bastrop County', 'Caldwell County', 'Hays County', 'Travis County', 'Williamson County']),
+          'mi': ('fl_florida_zip_codes_geo.min.json',
+                 ['Miami-Dade County', 'Broward County', 'Palm Beach County'])}
+
+
+def simplify_line(points, tolerance):
+    '''
+    Returns the points kept by Douglas-Peucker simplification (first and last always kept)
+
+    Args:
+    points: np.array, (n, 2) coordinates
+    tolerance: float, maximum distance (in degrees) of a dropped point from the simplified line
+    '''
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            dists = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            dists = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(dists))
+        if dists[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+
+def _simplify_ring(ring, tolerance, precision):
+    points = np.asarray(ring, dtype=np.float64)
+    simplified = simplify_line(points, tolerance)
+    # a closed ring needs at least 4 points; keep the original ring if simplification collapses it
+    if len(simplified) < 4:
+        simplified = points
+    return np.round(simplified, precision).tolist()
+
+
+def simplify_geometry(geometry, tolerance, precision=5):
+    '''
+    Returns a simplified copy of a GeoJSON Polygon or MultiPolygon geometry
+
+    Args:
+    geometry: dict, GeoJSON geometry
+    tolerance: float, simplification tolerance in degrees (0 only rounds the coordinates)
+    precision: int, number of decimals kept in the coordinates
+    '''
+    if geometry['type'] == 'Polygon':
+        coords = [_simplify_ring(ring, tolerance, precision) for ring in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        coords = [[_simplify_ring(ring, tolerance, precision) for ring in polygon]
+                  for polygon in geometry['coordinates']]
+    else:
+        return geometry
+    return {'type': geometry['type'], 'coordinates': coords}
+
+
+def prepare_geojson(geojson_path, zipcodes, out_path=None, tolerance=0.0005, precision=5):
+    '''
+    Returns a FeatureCollection with only the given zipcodes, simplified, and writes it to
+    out_path (compact JSON) when given
+
+    Args:
+    geojson_path: str, path to a state *_zip_codes_geo.min.json file
+    zipcodes: iterable, zipcodes to keep
+    out_path: str, where to write the prepared FeatureCollection
+    tolerance: float, simplification tolerance in degrees (~50 m at the default)
+    precision: int, number of decimals kept in the coordinates
+    '''
+    wanted = set(str(z).zfill(5) for z in zipcodes)
+    with open(geojson_path) as response:
+        source = json.load(response)
+
+    features = [{'type': 'Feature',
+                 'properties': {zip_key: feature['properties'][zip_key]},
+                 'geometry': simplify_geometry(feature['geometry'], tolerance, precision)}
+                for feature in source['features'] if feature['properties'][zip_key] in wanted]
+    prepared = {'type': 'FeatureCollection', 'features': features}
+
+    if out_path is not None:
+        out_dir = os.path.dirname(out_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(out_path, 'w') as f:
+            json.dump(prepared, f, separators=(',', ':'))
+    return prepared
+
+
+def _cache_key(geojson_path, zipcodes, tolerance, precision):
+    stat = os.stat(geojson_path)
+    key = hashlib.md5(f'{os.path.abspath(geojson_path)}|{stat.st_size}|{stat.st_mtime_ns}|'
+                      f'{tolerance}|{precision}|'.encode())
+    key.update(','.join(sorted(set(str(z).zfill(5) for z in zipcodes))).encode())
+    return key.hexdigest()[:12]
+
+
+def load_metro_geojson(df, metro, geojson_dir, cache_dir, tolerance=0.0005, precision=5):
+    '''
+    Returns the prepared FeatureCollection for one metro, from the cache when it is up to date
+
+    Args:
+    df: pd.DataFrame, panel with 'Zipcode' and 'County' columns (e.g. all_areas_clusters_hier.csv)
+    metro: str, one of 'sf', 'ny', 'au', 'mi'
+    geojson_dir: str, folder with the state *_zip_codes_geo.min.json files
+    cache_dir: str, folder for the prepared per-metro files
+    tolerance: float, simplification tolerance in degrees
+    precision: int, number of decimals kept in the coordinates
+    '''
+    state_file, counties = metros[metro]
+    geojson_path = os.path.join(geojson_dir, state_file)
+    zipcodes = df.loc[df['County'].isin(counties), 'Zipcode'].astype(str).str.zfill(5).unique()
+
+    key = _cache_key(geojson_path, zipcodes, tolerance, precision)
+    cache_path = os.path.join(cache_dir, f'{metro}_zip_codes_geo.{key}.json')
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+    return prepare_geojson(geojson_path, zipcodes, cache_path, tolerance, precision)
+
+
+def load_all_metros(df, geojson_dir, cache_dir, tolerance=0.0005, precision=5):
+    '''
+    Returns a dict of {metro: FeatureCollection} for the four metros (see load_metro_geojson)
+    '''
+    return {metro: load_metro_geojson(df, metro, geojson_dir, cache_dir, tolerance, precision)
+            for metro in metros}
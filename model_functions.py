@@ -5,6 +5,11 @@ Created by Douglas Pizac, Jane Dickson, Ethan Zien, and Casey Hoffman
 '''
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
+from joblib import Parallel, delayed, effective_n_jobs
+import joblib
+import copy
+import time
+from scipy import sparse, stats
 import pandas as pd
 import numpy as np
 import seaborn as sns
@@ -13,32 +18,240 @@ import matplotlib.pyplot as plt
 feature_cols = ['Rent','State-County','State','Year',
                              'City','Metro','County','Zipcode','SizeRank','pct_unemployed']
 
-def forest_regressor(df, datestr):
+class FeatureMatrix:
+    '''
+    Model-ready features built once per dataset (see build_feature_matrix): a C-contiguous
+    float32 array plus the column names, dates and log-rent target of every row.
+
+    Rows are ordered by Date (stable, so a frame already sorted by date keeps its order), so
+    each train/test date split is a contiguous block and split() returns views of X instead
+    of copies. Built with by_cluster = True, rows are ordered by Clusters then Date so each
+    cluster, and each date split within a cluster, is a view as well.
+
+    Attributes:
+    X: np.array, float32 features (rows x columns)
+    y: np.array, target (log rent unless built with ytype = 'normal'), None if there is no Rent
+    columns: list, feature names
+    dates: pd.Index, date of every row
+    clusters: np.array, cluster of every row (None without a 'Clusters' column)
+    rows: np.array, position of every row in the source DataFrame
+    '''
+
+    def __init__(self, X, y, columns, dates, clusters = None, rows = None):
+        self.X = X
+        self.y = y
+        self.columns = list(columns)
+        self.dates = dates
+        self.clusters = clusters
+        self.rows = rows if rows is not None else np.arange(X.shape[0])
+        self.date_sorted = bool(np.all(dates[1:] >= dates[:-1]))
+        self.cluster_sorted = clusters is not None and bool(np.all(clusters[1:] >= clusters[:-1]))
+
+    def __len__(self):
+        return self.X.shape[0]
+
+    def _subset(self, key):
+        return FeatureMatrix(self.X[key],
+                             None if self.y is None else self.y[key],
+                             self.columns,
+                             self.dates[key],
+                             None if self.clusters is None else self.clusters[key],
+                             self.rows[key])
+
+    def cluster(self, label):
+        '''Returns the rows of one cluster (a view when rows are ordered by cluster)'''
+        if self.clusters is None:
+            raise ValueError('FeatureMatrix was built without a Clusters column')
+        if self.cluster_sorted:
+            start = np.searchsorted(self.clusters, label, side = 'left')
+            stop = np.searchsorted(self.clusters, label, side = 'right')
+            return self._subset(slice(start, stop))
+        return self._subset(self.clusters == label)
+
+    def split(self, datestr):
+        '''Returns the (train, test) rows, train < datestr <= test'''
+        train_mask = np.asarray(self.dates < datestr)
+        if self.date_sorted:
+            train_index = int(train_mask.sum())
+            return self._subset(slice(0, train_index)), self._subset(slice(train_index, None))
+        return self._subset(train_mask), self._subset(~train_mask)
+
+    def window(self, start = None, end = None):
+        '''Returns the rows with start <= date < end (either bound may be None)'''
+        keep = np.ones(len(self), dtype = bool)
+        if start is not None:
+            keep &= np.asarray(self.dates >= start)
+        if end is not None:
+            keep &= np.asarray(self.dates < end)
+        if self.date_sorted:
+            rows = np.flatnonzero(keep)
+            return self._subset(slice(rows[0], rows[-1] + 1) if len(rows) else slice(0, 0))
+        return self._subset(keep)
+
+    def frame(self):
+        '''Returns X as a DataFrame (Date index) sharing memory with X'''
+        return pd.DataFrame(self.X, columns = self.columns, index = self.dates, copy = False)
+
+    def target(self):
+        '''Returns y as a pd.Series named 'Rent' with a Date index'''
+        return pd.Series(self.y, index = self.dates, name = 'Rent')
+
+
+def build_feature_matrix(df, drop = feature_cols, ytype = 'log', encode_objects = False, sort = True,
+                         by_cluster = False):
+    '''
+    Returns a FeatureMatrix with the model features of df
+
+    args:
+
+    df: pd.DataFrame, Dataframe indexed by Date with features and the 'Rent' target
+    drop: list, columns that are not features (missing ones are ignored)
+    ytype: str, 'log' for log-transformed rent, 'normal' for the original rent
+    encode_objects: bool, label encode non-numeric columns (as PCARandomForest.preProc);
+                    otherwise non-numeric columns raise a TypeError
+    sort: bool, order rows by Date so date splits are contiguous (False keeps the frame's order)
+    by_cluster: bool, order rows by Clusters then Date instead, so clusters are contiguous too
+                (as forest_clusters needs; the rows no longer follow the frame's order)
+
+    '''
+    columns = [col for col in df.columns if col not in drop]
+    dates = df.index
+    clusters = df['Clusters'].to_numpy() if 'Clusters' in df.columns else None
+
+    if not sort:
+        rows = np.arange(len(df))
+    elif by_cluster and clusters is not None:
+        rows = np.lexsort((np.argsort(np.argsort(dates, kind = 'stable'), kind = 'stable'), clusters))
+    else:
+        rows = np.argsort(dates, kind = 'stable')
+
+    X = np.empty((len(df), len(columns)), dtype = np.float32, order = 'C')
+    for j, col in enumerate(columns):
+        values = df[col]
+        if not pd.api.types.is_numeric_dtype(values):
+            if not encode_objects:
+                raise TypeError(f'column {col} is not numeric; drop it or set encode_objects = True')
+            values = pd.Series(pd.factorize(values, sort = True)[0])
+        X[:, j] = values.to_numpy(dtype = np.float32)[rows]
+
+    y = None
+    if 'Rent' in df.columns:
+        y = df['Rent'].to_numpy(dtype = np.float64)[rows]
+        if ytype == 'log':
+            y = np.log(y)
+        elif ytype != 'normal':
+            raise ValueError("ytype must be 'log' or 'normal'")
+
+    return FeatureMatrix(X, y, columns, dates[rows],
+                         None if clusters is None else clusters[rows], rows)
+
+
+def forest_regressor(df, datestr, n_estimators = 600, n_jobs = None):
     '''Returns a fit Random Forest model, the testing features, and the testing targets
 
         Args:
-        df: pd.DataFrame, Dataframe containing features and target to evaluate with Random Forest
+        df: pd.DataFrame or FeatureMatrix, Dataframe containing features and target to evaluate with Random Forest
         datestr: str, date by which to split the train/test data (train < datestr, test >= datestr)
+        n_estimators: int, number of trees
+        n_jobs: int, number of jobs used to fit and predict (None is one job)
 
     '''
+    features = df if isinstance(df, FeatureMatrix) else build_feature_matrix(df)
+    train, test = features.split(datestr)
+    rfc = RandomForestRegressor(n_estimators = n_estimators, n_jobs = n_jobs)
+    rfc.fit(train.frame(), train.y)
+    # data window (first date, last date) each tree was trained on, see update_forest
+    rfc.tree_windows_ = [_window_bounds(train)] * n_estimators
     
-    
-    X = df.copy()
-    for feature in feature_cols:
-        try:
-            X.drop(feature, axis = 1, inplace = True)
-        except:
-            continue
-    y = np.log(df['Rent'])
-    rfc = RandomForestRegressor(n_estimators = 600)
-    Xtrain = X.loc[X.index <datestr]
-    train_index = Xtrain.shape[0]
-    Xtest = X[train_index:]
-    ytrain = y[:train_index]
-    ytest = y[train_index:]
-    rfc.fit(Xtrain,ytrain)
-    
-    return rfc, Xtest,ytest
+    return rfc, test.frame(), test.target()
+
+def _window_bounds(features):
+    return (str(pd.Timestamp(features.dates.min()).date()), str(pd.Timestamp(features.dates.max()).date()))
+
+def update_forest(model, df, start, end = None, n_new_trees = 100, retire = 0):
+    '''Adds trees trained on a recent data window to a fitted forest (warm start), optionally
+    retiring the oldest trees. Returns the updated model; the data window each tree saw is
+    kept in model.tree_windows_.
+
+        Args:
+        model: fitted RandomForestRegressor (e.g. from forest_regressor), or the path of one saved
+               with joblib (the updated model is saved back to the same path)
+        df: pd.DataFrame or FeatureMatrix, Dataframe containing features and target
+        start: str, first date of the window the new trees are trained on (inclusive)
+        end: str, end of the window (exclusive, None for all later dates)
+        n_new_trees: int, number of trees to add
+        retire: int, number of oldest trees to drop after adding the new ones
+
+    '''
+    path = None
+    if isinstance(model, str):
+        path = model
+        model = joblib.load(path)
+
+    features = df if isinstance(df, FeatureMatrix) else build_feature_matrix(df)
+    window = features.window(start, end)
+    if len(window) == 0:
+        raise ValueError(f'no rows between {start} and {end}')
+
+    windows = list(getattr(model, 'tree_windows_', [None] * len(model.estimators_)))
+    # warm start only for this fit, so a later fit() of the returned model refits from scratch
+    warm_start = model.warm_start
+    model.set_params(warm_start = True, n_estimators = len(model.estimators_) + n_new_trees)
+    try:
+        model.fit(window.frame(), window.y)
+    finally:
+        model.set_params(warm_start = warm_start)
+    windows += [_window_bounds(window)] * n_new_trees
+
+    if retire:
+        if retire >= len(model.estimators_):
+            raise ValueError('cannot retire every tree of the forest')
+        del model.estimators_[:retire]
+        windows = windows[retire:]
+        model.set_params(n_estimators = len(model.estimators_))
+    model.tree_windows_ = windows
+
+    if path is not None:
+        joblib.dump(model, path)
+    return model
+
+def refresh_report(model, df, start, datestr, n_new_trees = 100, retire = 0):
+    '''Returns the incrementally updated model and a dictionary comparing it with a full refit:
+    holdout RMSE (in dollars) of both, the gap between them, and the time each took.
+    The model passed in is not modified.
+
+        Args:
+        model: fitted RandomForestRegressor (e.g. from forest_regressor)
+        df: pd.DataFrame or FeatureMatrix, Dataframe containing features and target
+        start: str, first date of the window the new trees are trained on (inclusive)
+        datestr: str, date by which to split the train/test data (train < datestr, test >= datestr)
+        n_new_trees: int, number of trees to add
+        retire: int, number of oldest trees to drop
+
+    '''
+    features = df if isinstance(df, FeatureMatrix) else build_feature_matrix(df)
+    train, test = features.split(datestr)
+
+    # copy outside the timer so incremental_seconds is the warm-start fit only
+    updated = copy.deepcopy(model)
+    begin = time.perf_counter()
+    updated = update_forest(updated, features, start, datestr, n_new_trees, retire)
+    incremental_seconds = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    refit = RandomForestRegressor(n_estimators = len(updated.estimators_), n_jobs = model.n_jobs)
+    refit.fit(train.frame(), train.y)
+    refit_seconds = time.perf_counter() - begin
+
+    actual = np.exp(test.y)
+    incremental_rmse = mean_squared_error(actual, np.exp(updated.predict(test.frame())), squared = False)
+    refit_rmse = mean_squared_error(actual, np.exp(refit.predict(test.frame())), squared = False)
+    report = {'incremental_RMSE': incremental_rmse,
+              'refit_RMSE': refit_rmse,
+              'RMSE_gap': incremental_rmse - refit_rmse,
+              'incremental_seconds': incremental_seconds,
+              'refit_seconds': refit_seconds}
+    return updated, report
 
 def abs_relative_error(ytest,ypred,df):
     '''returns a plot of the metro area rent errors relative to the rent price
@@ -64,14 +277,97 @@ def abs_relative_error(ytest,ypred,df):
     plt.legend(loc = 'upper left')
     
 
-def forest_clusters(df,datestr):
+class ClusterModelSet:
+    '''
+    One fitted model per 'Clusters' value (as trained by forest_clusters), with routed
+    prediction for batches that mix zipcodes from different clusters.
+
+    Attributes:
+    models: dict, {cluster: fitted model}
+    cluster_col: str, name of the cluster column in the batches to predict
+    '''
+
+    def __init__(self, models, cluster_col = 'Clusters'):
+        self.models = dict(models)
+        self.cluster_col = cluster_col
+
+    def __getitem__(self, cluster):
+        return self.models[cluster]
+
+    def __len__(self):
+        return len(self.models)
+
+    def _features(self):
+        model = next(iter(self.models.values()))
+        return list(model.feature_names_in_) if hasattr(model, 'feature_names_in_') else None
+
+    def predict(self, X, clusters = None, n_jobs = None):
+        '''
+        returns the predictions for X in its original row order, each row scored by the
+        model of its cluster
+
+        Rows are grouped with a single argsort on the cluster labels, each model predicts
+        once on its contiguous block, and the results are scattered back.
+
+        args:
+
+        X: pd.DataFrame (with the cluster column), FeatureMatrix or np.array of features
+        clusters: array, cluster of every row (defaults to the cluster column of X)
+        n_jobs: int, number of threads predicting clusters in parallel (None predicts one at a time)
+
+        '''
+        columns = self._features()
+        if isinstance(X, FeatureMatrix):
+            clusters = X.clusters if clusters is None else clusters
+            columns = X.columns if columns is None else columns
+            values = X.frame()[columns].to_numpy() if columns != X.columns else X.X
+        elif isinstance(X, pd.DataFrame):
+            clusters = X[self.cluster_col].to_numpy() if clusters is None else clusters
+            columns = list(X.columns) if columns is None else columns
+            values = X[columns].to_numpy(dtype = np.float32)
+        else:
+            if clusters is None:
+                raise ValueError('clusters must be given when X is an array')
+            values = np.asarray(X, dtype = np.float32)
+        clusters = np.asarray(clusters)
+
+        order = np.argsort(clusters, kind = 'stable')
+        labels, starts = np.unique(clusters[order], return_index = True)
+        missing = [label for label in labels if label not in self.models]
+        if missing:
+            raise KeyError(f'no model for clusters {missing}')
+        stops = np.append(starts[1:], len(order))
+        values = np.ascontiguousarray(values[order], dtype = np.float32)
+
+        def predict_block(label, start, stop):
+            block = values[start:stop]
+            if columns is not None:
+                block = pd.DataFrame(block, columns = columns, copy = False)
+            return self.models[label].predict(block)
+
+        blocks = zip(labels, starts, stops)
+        if n_jobs is None:
+            results = [predict_block(*block) for block in blocks]
+        else:
+            results = Parallel(n_jobs = n_jobs, prefer = 'threads')(delayed(predict_block)(*block) for block in blocks)
+
+        predictions = np.empty(len(order))
+        for start, stop, result in zip(starts, stops, results):
+            predictions[order[start:stop]] = result
+        return predictions
+
+
+def forest_clusters(df,datestr,n_estimators = 600,n_jobs = None):
     '''
-    returns a dictionary containing Random Forest results for each cluster
+    returns a dictionary containing Random Forest results for each cluster,
+    and the fitted models as a ClusterModelSet under 'models'
 
     args:
 
-    df: pd.DataFrame, DataFrame containing features, target, and a column 'Clusters' to slice by
+    df: pd.DataFrame or FeatureMatrix, DataFrame containing features, target, and a column 'Clusters' to slice by
     datestr: str, date by which to split the train/test data (train < datestr, test >= datestr)
+    n_estimators: int, number of trees per cluster
+    n_jobs: int, number of jobs used to fit and predict (None is one job)
 
     '''
 
@@ -80,20 +376,17 @@ def forest_clusters(df,datestr):
     except:
         raise TypeError('Index must be dates formattted as a str and (YYYY-mm-dd)')
     cluster_res = dict()
+    cluster_models = dict()
+    features = df if isinstance(df, FeatureMatrix) else build_feature_matrix(df, by_cluster = True)
 
-    for cluster in range(len(df['Clusters'].unique())):
+    for cluster in range(len(np.unique(features.clusters))):
     
-        X = df.loc[df['Clusters'] == cluster].copy()
-        y = np.log(X.Rent)
-        X = X.drop(feature_cols, axis = 1)
-        
-        Xtrain = X.loc[X.index <datestr]
-        train_index = Xtrain.shape[0]
-        Xtest = X[train_index:]
-        ytrain = y[:train_index]
-        ytest = y[train_index:]
-        rfc_cluster = RandomForestRegressor(n_estimators=600)
+        train, test = features.cluster(cluster).split(datestr)
+        Xtrain, ytrain = train.frame(), train.y
+        Xtest, ytest = test.frame(), test.y
+        rfc_cluster = RandomForestRegressor(n_estimators=n_estimators, n_jobs=n_jobs)
         rfc_cluster.fit(Xtrain,ytrain)
+        cluster_models[cluster] = rfc_cluster
         cluster_res[f'cluster{cluster}_train_score'] = rfc_cluster.score(Xtrain,ytrain)
         cluster_res[f'cluster{cluster}_test_score'] = rfc_cluster.score(Xtest,ytest)
         cluster_res[f'cluster{cluster}_test_set'] = np.array(ytest)
@@ -101,5 +394,125 @@ def forest_clusters(df,datestr):
         cluster_res[f'cluster{cluster}_RMSE'] = mean_squared_error(np.exp(ytest),
                                                  np.exp(cluster_res[f'cluster{cluster}_predictions'])
                                                  ,squared = False)
+    cluster_res['models'] = ClusterModelSet(cluster_models)
     return cluster_res
-        
\ No newline at end of file
+
+def cluster_profile(df, features = None, cluster_col = 'Clusters', scaled = False):
+    '''
+    returns a tuple (profile, anova) describing the clusters
+
+    profile: pd.DataFrame indexed by cluster with (statistic, feature) columns for the
+             count, mean, median and std of every feature
+    anova: pd.DataFrame with the one-way ANOVA F and p-values of every feature across clusters
+           (same columns as the cluster EDA notebook: feature_name, F_value, p_value)
+
+    Counts, means, stds and the ANOVA all come from one grouped pass of sufficient statistics
+    (per-cluster counts, sums and sums of squares) over a float matrix; medians come from one
+    sort by cluster. Missing values are ignored per feature.
+
+    args:
+
+    df: pd.DataFrame, DataFrame containing the features and a column 'Clusters'
+    features: list, features to profile (defaults to every numeric column but the cluster column)
+    cluster_col: str, name of the cluster column
+    scaled: bool, report medians of MinMax-scaled features (as the cluster line plots)
+
+    '''
+    if features is None:
+        features = [col for col in df.select_dtypes(include = ['number', 'bool']).columns if col != cluster_col]
+    X = df[features].to_numpy(dtype = np.float64)
+    labels, codes = np.unique(df[cluster_col].to_numpy(), return_inverse = True)
+    n_clusters = len(labels)
+
+    observed = ~np.isnan(X)
+    # centering keeps the sums of squares accurate for large-valued features
+    center = np.nanmean(X, axis = 0)
+    Xc = np.where(observed, X - center, 0)
+
+    groups = sparse.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))),
+                               shape = (n_clusters, len(codes)))
+    counts = groups @ observed.astype(np.float64)
+    sums = groups @ Xc
+    sumsq = groups @ (Xc * Xc)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        means = sums / counts
+        within = sumsq - sums * means
+        std = np.sqrt(within / (counts - 1))
+
+        total = counts.sum(axis = 0)
+        grand_mean = sums.sum(axis = 0) / total
+        between = (counts * (means - grand_mean)**2).sum(axis = 0, where = counts > 0)
+        k = (counts > 0).sum(axis = 0)
+        F = (between / (k - 1)) / (within.sum(axis = 0, where = counts > 0) / (total - k))
+    p = stats.f.sf(F, k - 1, total - k)
+
+    order = np.argsort(codes, kind = 'stable')
+    bounds = np.searchsorted(codes[order], np.arange(n_clusters + 1))
+    X_sorted = X[order]
+    medians = np.vstack([np.nanmedian(X_sorted[bounds[i]:bounds[i + 1]], axis = 0) for i in range(n_clusters)])
+    if scaled:
+        low, high = np.nanmin(X, axis = 0), np.nanmax(X, axis = 0)
+        medians = (medians - low) / np.where(high > low, high - low, 1)
+
+    index = pd.Index(labels, name = cluster_col)
+    profile = pd.concat({'count': pd.DataFrame(counts, index = index, columns = features),
+                         'mean': pd.DataFrame(means + center, index = index, columns = features),
+                         'median': pd.DataFrame(medians, index = index, columns = features),
+                         'std': pd.DataFrame(std, index = index, columns = features)}, axis = 1)
+    anova = pd.DataFrame({'feature_name': features, 'F_value': F, 'p_value': p})
+    return profile, anova
+
+
+def _tree_predict(trees, X, out):
+    '''Fills one row of out per tree with the tree's predictions for X'''
+    for i, tree in enumerate(trees):
+        out[i] = tree.predict(X, check_input = False)
+
+def forest_prediction_intervals(model, X, quantiles = (0.05, 0.95), chunk_size = 10000, n_jobs = -1):
+    '''
+    returns a DataFrame with the point prediction, the prediction interval across trees
+    and its spread, all in dollars (the model is assumed to predict log rent)
+
+    Trees are evaluated in parallel on chunks of rows, so memory stays bounded by
+    n_estimators x chunk_size regardless of the size of X.
+
+    args:
+
+    model: fitted RandomForestRegressor (e.g. from forest_regressor or forest_clusters)
+    X: pd.DataFrame or np.array, features to predict on
+    quantiles: tuple, (lower, upper) quantiles across trees
+    chunk_size: int, number of rows evaluated at a time
+    n_jobs: int, number of threads evaluating trees (-1 uses all cores)
+
+    '''
+    index = None
+    if isinstance(X, pd.DataFrame):
+        index = X.index
+        if hasattr(model, 'feature_names_in_'):
+            X = X[model.feature_names_in_]
+    X = np.ascontiguousarray(X, dtype = np.float32)
+
+    trees = model.estimators_
+    n_workers = min(effective_n_jobs(n_jobs), len(trees))
+    tree_groups = np.array_split(np.arange(len(trees)), n_workers)
+    chunk_size = min(chunk_size, X.shape[0]) or 1
+    tree_preds = np.empty((len(trees), chunk_size))
+
+    point = np.empty(X.shape[0])
+    lower = np.empty(X.shape[0])
+    upper = np.empty(X.shape[0])
+    with Parallel(n_jobs = n_workers, prefer = 'threads', require = 'sharedmem') as parallel:
+        for start in range(0, X.shape[0], chunk_size):
+            stop = min(start + chunk_size, X.shape[0])
+            out = tree_preds[:, :stop - start]
+            parallel(delayed(_tree_predict)([trees[i] for i in group], X[start:stop], out[group[0]:group[-1] + 1])
+                     for group in tree_groups)
+            point[start:stop] = out.mean(axis = 0)
+            lower[start:stop], upper[start:stop] = np.quantile(out, quantiles, axis = 0)
+
+    intervals = pd.DataFrame({'Prediction':np.exp(point),
+                              'Lower':np.exp(lower),
+                              'Upper':np.exp(upper)}, index = index)
+    intervals['Spread'] = intervals['Upper'] - intervals['Lower']
+    return intervals
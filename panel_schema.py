@@ -0,0 +1,202 @@
+'''
+Normalized (star schema) panel
+
+join_dfs repeats every per-zipcode (ACS), per-state-year (PersonalIncome), per-month
+(income level volumes) and per-county-month (AQIMean) value on every zipcode-month row.
+normalize_panel splits the merged panel into a slim fact table (zip_id, month_id, Rent)
+and dimension tables holding each column once at the grain it actually varies at.
+StarPanel.materialize rebuilds a wide model-ready frame only for the requested rows and
+columns, with integer lookups instead of merges.
+'''
+import os
+
+import pandas as pd
+import numpy as np
+
+# compound dimension grains, checked in this order after the month and zipcode dimensions;
+# their keys are looked up through the zipcode (State, County) and month (Year) dimensions
+compound_grains = {'state_year': ['State', 'Year'],
+                   'zipcode_year': ['Zipcode', 'Year'],
+                   'county_month': ['State', 'County', 'Date']}
+
+
+def _is_constant(codes, order, values):
+    '''True if values never change within a group of codes (order sorts the rows by group)'''
+    value_codes = pd.factorize(values)[0][order]
+    group_codes = codes[order]
+    same_group = group_codes[1:] == group_codes[:-1]
+    return not np.any(same_group & (value_codes[1:] != value_codes[:-1]))
+
+
+def _group_codes(panel, keys):
+    codes = panel.groupby(keys, sort = True).ngroup().to_numpy()
+    return codes, np.argsort(codes, kind = 'stable')
+
+
+def normalize_panel(df):
+    '''
+    Returns a StarPanel with the fact table and dimension tables of the merged panel
+
+    Args:
+    df: pd.DataFrame, merged panel (e.g. zillow_full) with 'Zipcode', 'Date' (column or index)
+        and 'Rent'; 'State', 'County' and 'Year' are needed for the compound dimensions
+    '''
+    panel = df.reset_index() if df.index.name == 'Date' else df
+    columns = [col for col in panel.columns if col not in ('Zipcode', 'Date')]
+
+    zipcodes, zip_ids = np.unique(panel['Zipcode'].to_numpy().astype(str), return_inverse = True)
+    dates, month_ids = np.unique(pd.to_datetime(panel['Date']).to_numpy(), return_inverse = True)
+    zip_order = np.argsort(zip_ids, kind = 'stable')
+    month_order = np.argsort(month_ids, kind = 'stable')
+
+    grain_of = dict()
+    for col in columns:
+        if col == 'Rent':
+            grain_of[col] = 'fact'
+        elif _is_constant(month_ids, month_order, panel[col]):
+            grain_of[col] = 'month'
+        elif _is_constant(zip_ids, zip_order, panel[col]):
+            grain_of[col] = 'zipcode'
+
+    available = {'Zipcode', 'Date'} | {col for col, grain in grain_of.items() if grain in ('month', 'zipcode')}
+    grain_codes = {name: _group_codes(panel, keys) for name, keys in compound_grains.items()
+                   if all(key in available for key in keys)}
+    for col in columns:
+        if col in grain_of:
+            continue
+        grain_of[col] = 'fact'
+        for name, (codes, order) in grain_codes.items():
+            if _is_constant(codes, order, panel[col]):
+                grain_of[col] = name
+                break
+
+    # first row of every zipcode / month / compound key holds its dimension values
+    zip_first = zip_order[np.searchsorted(zip_ids[zip_order], np.arange(len(zipcodes)))]
+    month_first = month_order[np.searchsorted(month_ids[month_order], np.arange(len(dates)))]
+    dims = {'zipcode': panel.iloc[zip_first][[c for c in columns if grain_of[c] == 'zipcode']].reset_index(drop = True),
+            'month': panel.iloc[month_first][[c for c in columns if grain_of[c] == 'month']].reset_index(drop = True)}
+    dims['zipcode'].insert(0, 'Zipcode', zipcodes)
+    dims['month'].insert(0, 'Date', dates)
+    for name, keys in compound_grains.items():
+        attrs = [c for c in columns if grain_of[c] == name]
+        if attrs:
+            codes, order = grain_codes[name]
+            first = order[np.searchsorted(codes[order], np.arange(codes.max() + 1))]
+            dims[name] = panel.iloc[first][keys + attrs].reset_index(drop = True)
+
+    facts = pd.DataFrame({'zip_id': zip_ids.astype(np.int32),
+                          'month_id': month_ids.astype(np.int32)})
+    for col in [c for c in columns if grain_of[c] == 'fact']:
+        facts[col] = panel[col].to_numpy()
+    return StarPanel(facts, dims, list(panel.columns))
+
+
+class StarPanel:
+    '''
+    Merged panel as a fact table plus dimension tables
+
+    Attributes:
+    facts: pd.DataFrame, one row per zipcode-month: zip_id, month_id, Rent (and any column
+           that varies at no coarser grain)
+    dims: dict of pd.DataFrame, 'zipcode' (row = zip_id), 'month' (row = month_id) and the
+          compound dimensions of compound_grains that hold columns, keyed by their key columns
+    columns: list, columns of the original panel, in order
+    '''
+
+    def __init__(self, facts, dims, columns):
+        self.facts = facts
+        self.dims = dims
+        self.columns = list(columns)
+
+    def grain(self, col):
+        '''Returns the name of the table holding a column'''
+        if col in self.facts.columns:
+            return 'fact'
+        for name, dim in self.dims.items():
+            if col in dim.columns:
+                return name
+        raise KeyError(f'unknown column {col}')
+
+    def memory_usage(self):
+        '''Returns the deep memory usage in bytes of every table'''
+        usage = {'facts': int(self.facts.memory_usage(deep = True).sum())}
+        usage.update({name: int(dim.memory_usage(deep = True).sum()) for name, dim in self.dims.items()})
+        return usage
+
+    def _row_ids(self, zipcodes, start, end):
+        keep = np.ones(len(self.facts), dtype = bool)
+        if zipcodes is not None:
+            if isinstance(zipcodes, str):
+                zipcodes = [zipcodes]
+            zip_ids = np.flatnonzero(self.dims['zipcode']['Zipcode'].isin([str(z) for z in zipcodes]).to_numpy())
+            keep &= np.isin(self.facts['zip_id'].to_numpy(), zip_ids)
+        if start is not None or end is not None:
+            dates = self.dims['month']['Date']
+            in_window = np.ones(len(dates), dtype = bool)
+            if start is not None:
+                in_window &= (dates >= pd.Timestamp(start)).to_numpy()
+            if end is not None:
+                in_window &= (dates <= pd.Timestamp(end)).to_numpy()
+            keep &= in_window[self.facts['month_id'].to_numpy()]
+        return np.flatnonzero(keep)
+
+    def materialize(self, columns = None, zipcodes = None, start = None, end = None):
+        '''
+        Returns the wide panel (Date index, like zillow_full) for the selected rows and columns only
+
+        Args:
+        columns: list, columns to include (defaults to all; 'Zipcode' is always included)
+        zipcodes: str or list, zipcodes to keep
+        start: str, first date to keep (inclusive)
+        end: str, last date to keep (inclusive)
+        '''
+        columns = [c for c in self.columns if c not in ('Date', 'Zipcode')] if columns is None else \
+                  [c for c in columns if c not in ('Date', 'Zipcode')]
+        rows = self._row_ids(zipcodes, start, end)
+        zip_ids = self.facts['zip_id'].to_numpy()[rows]
+        month_ids = self.facts['month_id'].to_numpy()[rows]
+        ids = {'zipcode': zip_ids, 'month': month_ids}
+
+        def key_values(key):
+            if key == 'Zipcode':
+                return self.dims['zipcode']['Zipcode'].to_numpy()[zip_ids]
+            if key == 'Date':
+                return self.dims['month']['Date'].to_numpy()[month_ids]
+            dim = 'zipcode' if key in self.dims['zipcode'].columns else 'month'
+            return self.dims[dim][key].to_numpy()[ids[dim]]
+
+        wide = {'Date': self.dims['month']['Date'].to_numpy()[month_ids],
+                'Zipcode': self.dims['zipcode']['Zipcode'].to_numpy()[zip_ids]}
+        for col in columns:
+            grain = self.grain(col)
+            if grain == 'fact':
+                wide[col] = self.facts[col].to_numpy()[rows]
+            elif grain in ids:
+                wide[col] = self.dims[grain][col].to_numpy()[ids[grain]]
+            else:
+                if grain not in ids:
+                    keys = compound_grains[grain]
+                    lookup = pd.MultiIndex.from_frame(self.dims[grain][keys])
+                    ids[grain] = lookup.get_indexer(pd.MultiIndex.from_arrays([key_values(k) for k in keys]))
+                found = ids[grain] >= 0
+                values = self.dims[grain][col].to_numpy()[np.where(found, ids[grain], 0)]
+                wide[col] = values if found.all() else pd.Series(values).where(found).to_numpy()
+
+        order = [c for c in self.columns if c in wide]
+        return pd.DataFrame(wide)[order].set_index('Date')
+
+    def save(self, path):
+        '''Writes every table to a folder (pickle files)'''
+        os.makedirs(path, exist_ok = True)
+        self.facts.to_pickle(os.path.join(path, 'facts.pkl'))
+        for name, dim in self.dims.items():
+            dim.to_pickle(os.path.join(path, f'dim_{name}.pkl'))
+        pd.Series(self.columns).to_pickle(os.path.join(path, 'columns.pkl'))
+
+    @classmethod
+    def load(cls, path):
+        '''Reads a StarPanel written by save'''
+        dims = {name[len('dim_'):-len('.pkl')]: pd.read_pickle(os.path.join(path, name))
+                for name in sorted(os.listdir(path)) if name.startswith('dim_')}
+        return cls(pd.read_pickle(os.path.join(path, 'facts.pkl')), dims,
+                   pd.read_pickle(os.path.join(path, 'columns.pkl')).tolist())
@@ -0,0 +1,106 @@
+'''
+Local SQLite store for the merged panel (zillow_full)
+
+The panel is written once with indexes on (Zipcode, Date), (State, County) and Year,
+so single-metro or single-zipcode slices are read through the indexes instead of
+re-reading the whole CSV and filtering in pandas.
+'''
+import sqlite3
+
+import pandas as pd
+import numpy as np
+
+default_table = 'zillow_full'
+
+# index name: indexed columns
+panel_indexes = {'zip_date': ['Zipcode', 'Date'],
+                 'state_county': ['State', 'County'],
+                 'year': ['Year']}
+
+
+def _quote(name):
+    '''Quotes a column or table name for SQL (names like State-County need it)'''
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def write_panel(df, db_path, table=default_table, chunksize=50000):
+    '''
+    Writes the panel to a SQLite database (replacing the table) and indexes it.
+    Dates are stored as 'YYYY-MM-DD' text, which sorts and compares chronologically.
+
+    Args:
+    df: pd.DataFrame, merged panel (Date as a column or as the index)
+    db_path: str, path of the database file (created if missing)
+    table: str, table name
+    chunksize: int, rows inserted per batch
+    '''
+    panel = df.reset_index() if df.index.name == 'Date' else df.copy()
+    panel['Date'] = pd.to_datetime(panel['Date']).dt.strftime('%Y-%m-%d')
+
+    con = sqlite3.connect(db_path)
+    try:
+        panel.to_sql(table, con, if_exists='replace', index=False, chunksize=chunksize)
+        for name, cols in panel_indexes.items():
+            if all(col in panel.columns for col in cols):
+                con.execute(f'CREATE INDEX IF NOT EXISTS {_quote(table + "_" + name)} '
+                            f'ON {_quote(table)} ({", ".join(_quote(col) for col in cols)})')
+        con.execute('ANALYZE')
+        con.commit()
+    finally:
+        con.close()
+
+
+def _in_clause(col, values, where, params):
+    if values is None:
+        return
+    if isinstance(values, (str, int, np.generic)):
+        values = [values]
+    # numpy scalars would be bound as blobs that never match, so bind Python values
+    values = [value.item() if isinstance(value, np.generic) else value for value in values]
+    where.append(f'{_quote(col)} IN ({", ".join("?" * len(values))})')
+    params.extend(values)
+
+
+def query_panel(db_path, zipcodes=None, states=None, counties=None, years=None,
+                start=None, end=None, columns=None, table=default_table):
+    '''
+    Returns the rows of the stored panel matching all the given filters, indexed by Date.
+    Filters are applied in SQL, so only the matching rows are read.
+
+    Args:
+    db_path: str, path of the database written by write_panel
+    zipcodes: str or list, zipcodes to keep
+    states: str or list, states to keep (e.g. 'NY')
+    counties: str or list, counties to keep (e.g. 'Kings County')
+    years: int or list, years to keep
+    start: str, first date to keep (YYYY-mm-dd, inclusive)
+    end: str, last date to keep (YYYY-mm-dd, inclusive)
+    columns: list, columns to return ('Date' is always returned)
+    table: str, table name
+    '''
+    where, params = [], []
+    _in_clause('Zipcode', zipcodes, where, params)
+    _in_clause('State', states, where, params)
+    _in_clause('County', counties, where, params)
+    _in_clause('Year', years, where, params)
+    if start is not None:
+        where.append('"Date" >= ?')
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end is not None:
+        where.append('"Date" <= ?')
+        params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+
+    if columns is None:
+        select = '*'
+    else:
+        select = ', '.join(_quote(col) for col in ['Date'] + [col for col in columns if col != 'Date'])
+    sql = f'SELECT {select} FROM {_quote(table)}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+
+    con = sqlite3.connect(db_path)
+    try:
+        dataframe = pd.read_sql_query(sql, con, params=params, parse_dates=['Date'])
+    finally:
+        con.close()
+    return dataframe.set_index('Date')
@@ -0,0 +1,110 @@
+'''
+Memory-mapped zipcode x month x feature store for the merged panel
+
+export_tensor writes zillow_full as a dense float32 cube (cube.npy) with sidecar index
+arrays (zipcodes.npy, dates.npy, features.npy). load_tensor memory-maps it read-only,
+so opening is near instant and every process on the box shares the same OS pages.
+'''
+import os
+
+import pandas as pd
+import numpy as np
+
+
+def export_tensor(df, out_dir, features=None, dtype=np.float32):
+    '''
+    Writes the panel as a zipcode x month x feature cube (missing cells are NaN)
+
+    Args:
+    df: pd.DataFrame, merged panel with 'Zipcode' and 'Date' (column or index)
+    out_dir: str, folder for cube.npy and the index arrays (created if missing)
+    features: list, feature columns to store (defaults to every numeric column)
+    dtype: numpy dtype of the cube
+    '''
+    panel = df.reset_index() if df.index.name == 'Date' else df
+    if features is None:
+        features = [col for col in panel.select_dtypes(include=['number', 'bool']).columns]
+    features = list(features)
+
+    zipcodes = np.unique(panel['Zipcode'].to_numpy().astype(str))
+    dates = np.unique(pd.to_datetime(panel['Date']).to_numpy().astype('datetime64[D]'))
+    zip_idx = np.searchsorted(zipcodes, panel['Zipcode'].to_numpy().astype(str))
+    date_idx = np.searchsorted(dates, pd.to_datetime(panel['Date']).to_numpy().astype('datetime64[D]'))
+
+    os.makedirs(out_dir, exist_ok=True)
+    cube = np.lib.format.open_memmap(os.path.join(out_dir, 'cube.npy'), mode='w+', dtype=dtype,
+                                     shape=(len(zipcodes), len(dates), len(features)))
+    cube[:] = np.nan
+    for j, col in enumerate(features):
+        cube[zip_idx, date_idx, j] = panel[col].to_numpy(dtype=dtype)
+    cube.flush()
+    del cube
+
+    np.save(os.path.join(out_dir, 'zipcodes.npy'), zipcodes)
+    np.save(os.path.join(out_dir, 'dates.npy'), dates)
+    np.save(os.path.join(out_dir, 'features.npy'), np.array(features, dtype=str))
+
+
+def load_tensor(out_dir):
+    '''
+    Returns a PanelTensor over the cube written by export_tensor (memory-mapped, read-only)
+
+    Args:
+    out_dir: str, folder passed to export_tensor
+    '''
+    return PanelTensor(np.load(os.path.join(out_dir, 'cube.npy'), mmap_mode='r'),
+                       np.load(os.path.join(out_dir, 'zipcodes.npy')),
+                       np.load(os.path.join(out_dir, 'dates.npy')),
+                       np.load(os.path.join(out_dir, 'features.npy')))
+
+
+def _positions(labels, wanted, name):
+    '''Returns positions of wanted labels, as a slice when they are contiguous (zero-copy)'''
+    lookup = pd.Index(labels)
+    positions = lookup.get_indexer(wanted)
+    if (positions < 0).any():
+        raise KeyError(f'unknown {name}: {list(np.asarray(wanted)[positions < 0][:5])}')
+    if len(positions) and np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions))):
+        return slice(positions[0], positions[0] + len(positions))
+    return positions
+
+
+class PanelTensor:
+    '''
+    Zipcode x month x feature cube with its index arrays
+
+    Attributes:
+    cube: np.memmap, (zipcodes, dates, features)
+    zipcodes: np.array, sorted zipcodes (axis 0)
+    dates: np.array, sorted months as datetime64[D] (axis 1)
+    features: np.array, feature names (axis 2)
+    '''
+
+    def __init__(self, cube, zipcodes, dates, features):
+        self.cube = cube
+        self.zipcodes = zipcodes
+        self.dates = dates
+        self.features = features
+
+    def select(self, zipcodes=None, start=None, end=None, features=None):
+        '''
+        Returns (cube, zipcodes, dates, features) for a slice of the store.
+        Date windows are always views; zipcode and feature selections are views when they
+        are contiguous in the stored order (zipcodes are sorted, so a zipcode range is) and
+        copies otherwise.
+
+        Args:
+        zipcodes: list, zipcodes to keep
+        start: str, first month to keep (inclusive)
+        end: str, last month to keep (inclusive)
+        features: list, features to keep, in the given order
+        '''
+        zip_key = slice(None) if zipcodes is None else _positions(self.zipcodes, np.asarray(zipcodes, dtype=str), 'zipcodes')
+        first = 0 if start is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), 'D'), 'left')
+        last = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), 'D'), 'right')
+        date_key = slice(first, last)
+        feature_key = slice(None) if features is None else _positions(self.features, list(features), 'features')
+
+        # index one axis at a time so slices stay views of the memmap
+        cube = self.cube[zip_key][:, date_key][:, :, feature_key]
+        return cube, self.zipcodes[zip_key], self.dates[date_key], self.features[feature_key]
@@ -1,6 +1,12 @@
 
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
 import pandas as pd
 import numpy as np
+from scipy.spatial import cKDTree
 
 # SF Metro
 sf_counties = ['Alameda County', 'Contra Costa County', 'Marin County', 'Napa County', 'San Mateo County', 
@@ -19,11 +25,86 @@ for state,counties in counties_dict.items():
     for county in counties:
         all_counties.append('%s-%s' % (state,county))
 
+state_abbr = {'Alabama':'AL','Alaska':'AK','Arizona':'AZ','Arkansas':'AR','California':'CA','Colorado':'CO',
+              'Connecticut':'CT','Delaware':'DE','District Of Columbia':'DC','District of Columbia':'DC',
+              'Florida':'FL','Georgia':'GA','Hawaii':'HI','Idaho':'ID','Illinois':'IL','Indiana':'IN','Iowa':'IA',
+              'Kansas':'KS','Kentucky':'KY','Louisiana':'LA','Maine':'ME','Maryland':'MD','Massachusetts':'MA',
+              'Michigan':'MI','Minnesota':'MN','Mississippi':'MS','Missouri':'MO','Montana':'MT','Nebraska':'NE',
+              'Nevada':'NV','New Hampshire':'NH','New Jersey':'NJ','New Mexico':'NM','New York':'NY',
+              'North Carolina':'NC','North Dakota':'ND','Ohio':'OH','Oklahoma':'OK','Oregon':'OR',
+              'Pennsylvania':'PA','Rhode Island':'RI','South Carolina':'SC','South Dakota':'SD','Tennessee':'TN',
+              'Texas':'TX','Utah':'UT','Vermont':'VT','Virginia':'VA','Washington':'WA','West Virginia':'WV',
+              'Wisconsin':'WI','Wyoming':'WY','Puerto Rico':'PR'}
+
+# raw ACS columns needed for the census features
+census_cols = ['total_pop','households','median_age','median_income','income_per_capita',
+               'pop_determined_poverty_status', 'poverty','gini_index','housing_units',
+               'different_house_year_ago_different_city','different_house_year_ago_same_city',
+               'pop_in_labor_force','aggregate_travel_time_to_work','bachelors_degree','employed_pop',
+               'unemployed_pop', 'employed_arts_entertainment_recreation_accommodation_food']
+
+# Zillow ID columns kept by transform_zillow (after load_zillow_long's renames)
+zillow_id_cols = ['Zipcode','City','State','Metro','County','SizeRank']
+
+# matches month column labels of ZRI ('2010-09') and ZORI ('2014-01', '2015-01-31', '1/31/2015') files
+month_col_pattern = r'^(\d{4}-\d{1,2}(-\d{1,2})?|\d{1,2}/\d{1,2}/\d{4})$'
+
+def load_zillow_long(path, ffill = False):
+    '''
+    Reads a wide Zillow file (ZRI or ZORI, one row per zipcode and one column per month)
+    into long format, one row per zipcode-month.
+    ID and month columns are detected from the header, the month labels are parsed once,
+    and the long frame is built with a NumPy reshape (rows ordered month by month, as pd.melt).
+
+    Args:
+    path: path to the data file, str
+    ffill: bool, forward-fill missing rents along the months of each zipcode
+
+    Returns: the ID columns ('RegionName' renamed to 'Zipcode', 'CountyName' to 'County'),
+             'Date' (01 of every month) and 'Rent'
+
+    '''
+    header = pd.read_csv(path, nrows = 0).columns
+    is_month = header.str.match(month_col_pattern)
+    month_cols = header[is_month]
+    id_cols = header[~is_month]
+    if len(month_cols) == 0:
+        raise ValueError(f'no month columns found in {path}')
+
+    dtypes = {col:'float64' for col in month_cols}
+    dtypes['RegionName'] = str
+    dataframe = pd.read_csv(path, dtype = dtypes)
+
+    dates = pd.DatetimeIndex([pd.Timestamp(label) for label in month_cols])
+    dates = dates.to_period('M').to_timestamp()
+    month_order = np.argsort(dates.to_numpy(), kind = 'stable')
+    dates = dates[month_order]
+
+    rents = dataframe[month_cols[month_order]].to_numpy(dtype = np.float64)
+    if ffill:
+        rents = pd.DataFrame(rents).ffill(axis = 1).to_numpy()
+
+    n_zips, n_months = rents.shape
+    long_df = {col:np.tile(dataframe[col].to_numpy(), n_months) for col in id_cols}
+    long_df['Date'] = np.repeat(dates.to_numpy(), n_zips)
+    long_df['Rent'] = rents.ravel(order = 'F')
+    long_df = pd.DataFrame(long_df)
+
+    long_df.rename(columns = {'RegionName':'Zipcode',
+                              'CountyName': 'County'}, inplace = True)
+    if 'Zipcode' in long_df.columns:
+        long_df['Zipcode'] = long_df['Zipcode'].str.zfill(5)
+    return long_df
+
 def transform_zillow(path):
     '''
-    Transforms the Zillow ZRI data file:
+    Transforms a zipcode-level Zillow ZRI or ZORI data file:
         - imputes missing rents by interpolation and backfilling
         - transforms date/rent columns into rows
+    The file needs the zipcode ID columns RegionName, City, State, Metro, CountyName and SizeRank
+    (ZRI and zipcode ZORI files); other ID columns (RegionID, RegionType, StateName) are dropped.
+    Metro-level ZORI files (RegionName, SizeRank, MsaName) have no zipcode, State or County
+    and raise a ValueError.
 
     Args:
     path: path to the data file, str
@@ -33,27 +114,13 @@ def transform_zillow(path):
         location: State, City, Metro, County, Zipcode
 
     '''
-    dataframe = pd.read_csv(path, dtype = {'RegionName':str})
-    dataframe.rename(columns = {'RegionName':'Zipcode',
-                                'CountyName': 'County'}, inplace = True)
-    dataframe['Zipcode'] = dataframe['Zipcode'].str.zfill(5)
-
-    dataframe = pd.melt(dataframe, id_vars =dataframe.columns[:7],
-                         value_vars = dataframe.columns[7:],
-                         var_name = 'Date', 
-                         value_name = 'Rent')
-    dataframe['Date'] = pd.to_datetime(dataframe['Date'])
-
-    fill_rents = dataframe[['Zipcode', 'Rent', 'Date']].copy()
-
-    # imputing missing Rent values
-    fill_rents = fill_rents.reset_index().pivot(index = 'Date',columns = 'Zipcode')['Rent'].reset_index()
-    fill_rents.fillna(method = 'ffill',inplace = True)
-    fill_rents = pd.melt(fill_rents, id_vars='Date', 
-                                      value_vars = fill_rents.columns[1:],
-                                      var_name='Zipcode',value_name = 'Rent')
-    dataframe.drop(['Rent', 'RegionID'], axis = 1, inplace = True)
-    dataframe = pd.merge(dataframe, fill_rents, on = ['Date','Zipcode'])
+    dataframe = load_zillow_long(path, ffill = True)
+    missing = [col for col in zillow_id_cols if col not in dataframe.columns]
+    if missing:
+        raise ValueError(f'{path} is missing the zipcode ID columns {missing} '
+                         '(RegionName, City, State, Metro, CountyName, SizeRank); '
+                         'metro-level files are not supported')
+    dataframe = dataframe[zillow_id_cols + ['Date','Rent']]
 
     #parsing year separately for merging with annual features
     dataframe['Year'] = dataframe['Date'].dt.year
@@ -70,9 +137,17 @@ def transform_zillow(path):
     return(dataframe)
 
 
-def transform_air_qual(path):
+def transform_air_qual(path, centroids_path = None, n_neighbors = 3, max_distance = 250):
     '''
     Args: path to **folder** containing the data files, str
+          centroids_path: path to the county centroids file (see load_county_centroids), str.
+              Opt-in: when given, counties without an EPA monitor are filled from their
+              nearest monitored counties (fill_air_qual, matched on county FIPS codes and
+              named as in the centroids file); by default (None) only the NYC counties
+              without a monitor are filled with the New York City average.
+          n_neighbors: number of monitored counties averaged for each unmonitored county, int
+          max_distance: only monitored counties within this distance (km) are used, float;
+              counties with none in range stay missing (None has no limit)
 
     Merge By: 
         time: Date (01 of every month)
@@ -82,18 +157,22 @@ def transform_air_qual(path):
 
     '''
     file_list = [(f'{path}/daily_42602_{year}.csv') for year in range(2010, 2021)]
-    cols = ['Date Local', 'Arithmetic Mean', 'State Name', 'County Name', 'City Name']
+    cols = ['Date Local', 'Arithmetic Mean', 'State Name', 'County Name', 'City Name', 'State Code', 'County Code']
+    code_types = {'State Code':str, 'County Code':str}
 
-    dataframe = pd.read_csv(file_list[0], usecols = cols)
+    dataframe = pd.read_csv(file_list[0], usecols = cols, dtype = code_types)
 
     for file in file_list[1:]:
-        new_df = pd.read_csv(file, usecols = cols)
+        new_df = pd.read_csv(file, usecols = cols, dtype = code_types)
         dataframe = pd.concat([dataframe, new_df], axis=0)
 
+    # 5-digit county FIPS code (Gazetteer GEOID), one per State/County Name
+    dataframe['Fips'] = dataframe['State Code'].str.zfill(2) + dataframe['County Code'].str.zfill(3)
+
     dataframe['Date Local'] = pd.to_datetime(dataframe['Date Local'])
     dataframe['Month'] = dataframe['Date Local'].dt.month
     dataframe['Year'] = dataframe['Date Local'].dt.year
-    dataframe = dataframe.groupby(['State Name', 'County Name', 'City Name', 'Year', 'Month'])[['Arithmetic Mean']].agg('mean').reset_index()
+    dataframe = dataframe.groupby(['State Name', 'County Name', 'City Name', 'Fips', 'Year', 'Month'])[['Arithmetic Mean']].agg('mean').reset_index()
     dataframe.Month = dataframe.Month.astype(str)
     dataframe.Month = dataframe.Month.str.zfill(2)
     dataframe['Date'] = '01/'+dataframe.Month.astype(str)+'/'+dataframe.Year.astype(str)
@@ -107,22 +186,124 @@ def transform_air_qual(path):
     
     
     dataframe['County'] = dataframe['County'] + ' County'
-    state_map = {'Florida':'FL','California':'CA','New York':'NY','Texas':'TX'}
-    dataframe['State'] = dataframe['State'].apply(lambda x: state_map[x] if x in state_map else x)
+    dataframe['State'] = dataframe['State'].map(state_abbr).fillna(dataframe['State'])
     dataframe['State-County'] = dataframe['State'] + '-' + dataframe['County']
+
+    if centroids_path is not None:
+        centroids = load_county_centroids(centroids_path)
+        dataframe = dataframe.groupby(['Date','Fips'])[['AQIMean']].mean().reset_index()
+        dataframe = fill_air_qual(dataframe, centroids, targets = all_counties,
+                                  n_neighbors = n_neighbors, max_distance = max_distance)
+        # county names from the centroids file (parishes, boroughs and cities keep their own)
+        dataframe = pd.merge(dataframe, centroids[['Fips','State','County']], on = 'Fips')
+        dataframe = dataframe[['Date','State','County','AQIMean']]
+        dataframe['State-County'] = dataframe['State'] + '-' + dataframe['County']
+        dataframe = dataframe[dataframe['State-County'].isin(all_counties)]
+        dataframe = dataframe.drop('State-County', axis=1).sort_values(['Date','State','County'])
+        return(dataframe.reset_index(drop=True))
+
     dataframe = dataframe[dataframe['State-County'].isin(all_counties)]
     
-    nyc_avg = dataframe[dataframe.City=='New York'].groupby('Date').mean().reset_index()
+    nyc_avg = dataframe[dataframe.City=='New York'].groupby('Date')[['AQIMean']].mean().reset_index()
     nyc_avg['State'] = 'NY'
     nyc_avg['City'] = 'New York'
-    nyc_aq = pd.concat((nyc_avg,nyc_avg,nyc_avg))
-    counties = ['New York County']*129+['Kings County']*129+['Richmond County']*129
-    nyc_aq['County']= counties
+    nyc_counties = ['New York County','Kings County','Richmond County']
+    nyc_aq = pd.concat([nyc_avg.assign(County = county) for county in nyc_counties])
     nyc_aq = nyc_aq[['State','County','City','AQIMean','Date']]
-    dataframe = pd.concat((dataframe,nyc_aq)).groupby(['Date','State','County']).mean().reset_index()
+    dataframe = pd.concat((dataframe,nyc_aq)).groupby(['Date','State','County'])[['AQIMean']].mean().reset_index()
     return(dataframe)
 
 
+def load_county_centroids(path):
+    '''
+    Returns county centroids (Fips, State, County, Latitude, Longitude) from a local file:
+    either a CSV with those columns or the Census Gazetteer counties file
+    (e.g. 2020_Gaz_counties_national.txt, tab separated: USPS, GEOID, NAME, INTPTLAT, INTPTLONG)
+
+    Args: path to the centroids file, str
+
+    '''
+    sep = '\t' if path.endswith('.txt') else ','
+    dataframe = pd.read_csv(path, sep = sep, dtype = str)
+    dataframe.columns = dataframe.columns.str.strip()
+    dataframe.rename(columns = {'GEOID':'Fips', 'USPS':'State', 'NAME':'County',
+                                'INTPTLAT':'Latitude', 'INTPTLONG':'Longitude'}, inplace = True)
+    dataframe = dataframe[['Fips','State','County','Latitude','Longitude']].copy()
+    dataframe['Fips'] = dataframe['Fips'].str.zfill(5)
+    dataframe[['Latitude','Longitude']] = dataframe[['Latitude','Longitude']].astype('float64')
+    return dataframe
+
+
+earth_radius_km = 6371.0
+
+def _unit_vectors(lat, lon):
+    '''3D unit vectors of lat/lon points (chord distance is monotonic in great-circle distance)'''
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack((np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)))
+
+
+def fill_air_qual(dataframe, centroids, targets = None, n_neighbors = 3, power = 2, max_distance = 250):
+    '''
+    Returns dataframe with rows added for target counties that have no monitor,
+    filled with the inverse-distance weighted mean of their nearest monitored counties
+    within max_distance. Counties with no monitored county in range get no rows (missing).
+    All unmonitored counties are filled in one batch: one KD-tree query over the county
+    centroids and one weighted sum over a months x monitored-counties matrix.
+
+    Args:
+        dataframe: pd.DataFrame, monthly county AQI (Date, Fips, AQIMean); counties are
+            matched on their 5-digit FIPS code, so parishes, boroughs and independent
+            cities match whatever their name
+        centroids: pd.DataFrame, output of load_county_centroids
+        targets: list of 'State-County' keys to fill, looked up by name in centroids
+            (defaults to every county in centroids)
+        n_neighbors: int, number of monitored counties averaged
+        power: float, inverse distance weighting exponent
+        max_distance: float, largest centroid distance (km) of a neighbor (None has no limit)
+
+    '''
+    centroids = centroids.drop_duplicates('Fips').set_index('Fips')
+    wide = dataframe.pivot_table(index = 'Date', columns = 'Fips', values = 'AQIMean')
+    wide = wide.loc[:, wide.columns.isin(centroids.index)]
+    monitored = wide.columns
+
+    candidates = centroids.index
+    if targets is not None:
+        keys = centroids['State'] + '-' + centroids['County']
+        candidates = candidates[keys.isin(targets).to_numpy()]
+    missing = candidates[~candidates.isin(monitored)]
+    if len(missing) == 0 or len(monitored) == 0:
+        return dataframe
+
+    monitored_xyz = _unit_vectors(centroids.loc[monitored, 'Latitude'].to_numpy(),
+                                  centroids.loc[monitored, 'Longitude'].to_numpy())
+    missing_xyz = _unit_vectors(centroids.loc[missing, 'Latitude'].to_numpy(),
+                                centroids.loc[missing, 'Longitude'].to_numpy())
+    k = min(n_neighbors, len(monitored))
+    # great-circle distance on the unit sphere -> chord length between unit vectors
+    bound = np.inf if max_distance is None else 2*np.sin(min(max_distance/earth_radius_km, np.pi)/2)
+    dist, idx = cKDTree(monitored_xyz).query(missing_xyz, k = k, distance_upper_bound = bound)
+    dist, idx = dist.reshape(len(missing), k), idx.reshape(len(missing), k)
+    # neighbors beyond the bound come back as (inf, len(monitored)): zero weight
+    in_range = np.isfinite(dist)
+    idx = np.where(in_range, idx, 0)
+    weights = np.where(in_range, 1 / np.maximum(dist, 1e-9)**power, 0)
+
+    # months x missing counties x neighbors
+    values = wide.to_numpy()[:, idx]
+    observed = ~np.isnan(values)
+    weight_sum = (observed * weights).sum(axis = 2)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        filled = (np.where(observed, values, 0) * weights).sum(axis = 2) / weight_sum
+
+    n_dates = len(wide.index)
+    fill_df = pd.DataFrame({'Date': np.repeat(wide.index.to_numpy(), len(missing)),
+                            'Fips': np.tile(missing.to_numpy(), n_dates),
+                            'AQIMean': filled.ravel()})
+    fill_df = fill_df.dropna(subset = ['AQIMean'])
+    return pd.concat((dataframe, fill_df), ignore_index = True)
+
+
 def transform_pers_income(path):
     '''
     Args: path to the data file, str
@@ -208,17 +389,62 @@ def transform_census(path):
         SELECT * FROM acs_zipcode`
 
     '''
-    dataframe = pd.read_csv(path, dtype={'zip_code':str})
+    dataframe = _read_census(path)
+    return(_census_features(dataframe))
+
+
+def transform_census_years(paths, cache_dir=None):
+    '''
+    Loads several ACS vintages in one pass (see transform_census for the per-file query).
+
+    Args:
+    paths: dict of {year: path}, one ACS 5-year file per vintage (e.g. {2016: ..., 2018: ...})
+    cache_dir: str, optional folder where the derived features are cached, keyed by
+        the source files (path, size, modification time)
+
+    Merge By: 
+        time: Year (join_dfs takes the latest vintage at or before each year)
+        location: Zipcode
+
+    Feature Name: same features as transform_census, plus 'Year' (ACS vintage)
+
+    '''
+    cache_file = None
+    if cache_dir is not None:
+        key = hashlib.md5()
+        for year in sorted(paths):
+            stat = os.stat(paths[year])
+            key.update(f'{year}|{os.path.abspath(paths[year])}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+        key.update(','.join(census_cols).encode())
+        cache_file = os.path.join(cache_dir, f'census_{key.hexdigest()}.pkl')
+        if os.path.exists(cache_file):
+            return pd.read_pickle(cache_file)
+
+    frames = []
+    for year in sorted(paths):
+        frame = _read_census(paths[year])
+        frame['Year'] = np.int64(year)
+        frames.append(frame)
+    dataframe = _census_features(pd.concat(frames, ignore_index=True))
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        dataframe.to_pickle(cache_file)
+    return(dataframe)
+
+
+def _read_census(path):
+    '''Reads only the ACS columns used by the census features, with explicit dtypes'''
+    dtypes = {col:'float64' for col in census_cols}
+    dtypes['zip_code'] = str
+    dataframe = pd.read_csv(path, usecols=census_cols+['zip_code'], dtype=dtypes)
     dataframe['zip_code'] = dataframe['zip_code'].str.zfill(5)
     dataframe.rename(columns={'zip_code':'Zipcode'}, inplace=True)
-    # dataframe['do_date'] = pd.to_datetime(dataframe['do_date'])
+    return dataframe[census_cols+['Zipcode']]
 
-    dataframe = dataframe[['total_pop','households','median_age','median_income','income_per_capita',
-                  'pop_determined_poverty_status', 'poverty','gini_index','housing_units',
-                  'different_house_year_ago_different_city','different_house_year_ago_same_city',
-                  'pop_in_labor_force','aggregate_travel_time_to_work','bachelors_degree','employed_pop',
-                  'unemployed_pop', 'employed_arts_entertainment_recreation_accommodation_food','Zipcode']]
 
+def _census_features(dataframe):
+    '''Derives the census ratio features from the raw ACS counts'''
     # pct poverty
     dataframe['pct_poverty'] = dataframe['poverty']/dataframe['pop_determined_poverty_status']
     dataframe.drop(['poverty','pop_determined_poverty_status'],axis=1,inplace=True)
@@ -253,9 +479,80 @@ def join_dfs(zillow_df,air_df=None,persinc_df=None,inclvl_df=None,census_df=None
         zillow_df=pd.merge(zillow_df,inclvl_df,on=['Date'],how='left')
         
     if census_df is not None:
-        zillow_df=pd.merge(zillow_df,census_df,on=['Zipcode'],how='left')
+        if 'Year' in census_df.columns:
+            zillow_df=_join_census_years(zillow_df,census_df)
+        else:
+            zillow_df=pd.merge(zillow_df,census_df,on=['Zipcode'],how='left')
     return zillow_df
 
+def _join_census_years(zillow_df,census_df):
+    '''
+    Joins multi-vintage census (transform_census_years) to every row from the latest ACS release
+    of its zipcode at or before the row's Year; years before a zipcode's first release use that
+    first release. Rows keep their order.
+    '''
+    releases = census_df[['Zipcode','Year']].rename(columns={'Year':'census_year'})
+    releases['census_year'] = releases['census_year'].astype('int64')
+    releases = releases.sort_values('census_year')
+    rows = zillow_df[['Zipcode','Year']].astype({'Year':'int64'})
+    rows['row'] = np.arange(len(rows))
+    rows = rows.sort_values('Year',kind='stable')
+
+    def asof(direction):
+        return pd.merge_asof(rows,releases,left_on='Year',right_on='census_year',
+                             by='Zipcode',direction=direction)['census_year']
+    release = np.empty(len(rows))
+    release[rows['row'].to_numpy()] = asof('backward').fillna(asof('forward')).to_numpy()
+
+    census = census_df.rename(columns={'Year':'census_year'})
+    census['census_year'] = census['census_year'].astype('float64')
+    joined = pd.merge(zillow_df.assign(census_year=release),census,on=['Zipcode','census_year'],how='left')
+    return joined.drop('census_year',axis=1)
+
+def build_zillow_full(zillow_path, airqual_path=None, persinc_path=None, inclvl_path=None,
+                      census_path=None, concurrent=True, executor='thread', max_workers=None,
+                      centroids_path=None):
+    '''
+    Returns the merged table (join_dfs) built from the source files.
+    The transforms do not depend on each other, so by default they run concurrently and
+    the join starts as soon as the last of them finishes.
+
+    Args:
+        zillow_path: str, path to the Zillow ZRI file
+        airqual_path, persinc_path, inclvl_path, census_path: str, paths of the optional sources
+            (None skips the source); census_path can also be a dict of {year: path} with one ACS
+            file per vintage (see transform_census_years)
+        concurrent: bool, run the source transforms concurrently (False runs them one after another)
+        executor: str, 'thread' (overlaps file I/O and parsing) or 'process' (also parallelizes the
+            pure-Python parts; results are pickled back to the parent)
+        max_workers: int, size of the pool (defaults to one worker per source)
+        centroids_path: str, county centroids file for the air quality fallback (see transform_air_qual)
+
+    '''
+    sources = {'zillow_df':(transform_zillow, zillow_path),
+               'air_df':(partial(transform_air_qual, centroids_path=centroids_path), airqual_path),
+               'persinc_df':(transform_pers_income, persinc_path),
+               'inclvl_df':(transform_income_level, inclvl_path),
+               'census_df':(transform_census_years if isinstance(census_path, dict) else transform_census,
+                            census_path)}
+    sources = {name:job for name,job in sources.items() if job[1] is not None}
+
+    if not concurrent:
+        loaded = {name:func(path) for name,(func,path) in sources.items()}
+        return join_dfs(**loaded)
+
+    if executor == 'thread':
+        pool_class = ThreadPoolExecutor
+    elif executor == 'process':
+        pool_class = ProcessPoolExecutor
+    else:
+        raise ValueError("executor must be 'thread' or 'process'")
+
+    with pool_class(max_workers=max_workers or len(sources)) as pool:
+        futures = {name:pool.submit(func, path) for name,(func,path) in sources.items()}
+        loaded = {name:future.result() for name,future in futures.items()}
+    return join_dfs(**loaded)
+
 def impute_by_county(df,colname,method):
     '''
     Returns series with missing values imputed by specifed method.